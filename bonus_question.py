@@ -3,26 +3,56 @@ from psychopy.hardware.keyboard import Keyboard
 from pathlib import Path
 import random
 import platform
-import glob
 import os
+import numpy as np
 import pandas as pd
 import sequences.params as pm
 import sequences.bonus_q as bq
 import sequences.stimuli_manager as sm
 import sequences.instr as it
+import sequences.flow as fl
 from sequences.common import get_win_dict
 
-def ask_sequence(start_item, seq_name, amodal_sequences, tools):
+def get_bonus_assets(amodal_sequences, tools):
+    '''Build the stimuli of the bonus question once for the six sequences of the run.
+    
+    Parameters
+    ----------
+    amodal_sequences : dict
+        A dictionary containing the sequences that are in the run {'A': [item1, item2, ...], ...}
+    tools : dict
+        A dictionary containing the tools needed for the experiment (see ask_sequence)
+        
+    Returns
+    -------
+    dict
+        The grid of images, the index of each item in the grid, the slot positions and the instructions'''
+
+    lang = tools['exp_info']['lang']
+    win = tools['win']
+
+    catalog = sm.get_stim_catalog(pm.input_dir, lang)
+    items = [item for seq in amodal_sequences.values() for item in seq]
+    slot_positions = [(-0.45, 0.4), (-0.15, 0.4), (0.15, 0.4), (0.45, 0.4), (0.75, 0.4)]
+    return {
+        'grid': bq.BonusGrid(win, tools['aspect_ratio'], [catalog[item]['img'] for item in items], slot_positions),
+        'item_idx': {item: i for i, item in enumerate(items)},
+        'slot_positions': slot_positions,
+        'instr2': visual.TextStim(win, text=it.get_txt(lang, 'instr_bonus2_fn'), pos=(0, 0.7), color="black"),
+        'validate': visual.TextStim(win, text=it.get_txt(lang, 'instr_bonus3_fn'), pos=(0, 0), color="black"),
+    }
+
+def ask_sequence(sequence, seq_name, assets, tools):
     '''Ask the participant to place the images in the correct order and save the data.
     
     Parameters
     ----------
-    start_item : str
-        The starting item of the sequence
+    sequence : list
+        The items of the sequence, the first one is given as a cue
     seq_name : str
         The name of the sequence
-    amodal_sequences : dict
-        A dictionary containing the sequences that are in the run {'A': [item1, item2, ...], ...}
+    assets : dict
+        The stimuli shared by the six sequences, see get_bonus_assets
     tools : dict
         A dictionary containing the tools needed for the experiment. It contains:
             - exp_info: a dictionary containing the experiment information
@@ -36,160 +66,66 @@ def ask_sequence(start_item, seq_name, amodal_sequences, tools):
 
     subject_id = tools['exp_info']['ID']
     run_id = tools['exp_info']['run']
-    lang = tools['exp_info']['lang']
     win = tools['win']
     background = tools['background']
-    aspect_ratio = tools['aspect_ratio']
     logger = tools['logger']
+    event_fun = tools['event_fun']
+    grid = assets['grid']
+    instr2 = assets['instr2']
 
     out_dir = Path(f"{pm.output_dir}/sub-{subject_id}/bonus")
     os.makedirs(out_dir, exist_ok=True)
     out_path = Path(f"{out_dir}/sub-{subject_id}_run{run_id}_bonus_{seq_name}.csv")
 
-    txt_instr2 = it.get_txt(lang, 'instr_bonus2_fn')
-    instr2 = visual.TextStim(win, text=txt_instr2, pos=(0, 0.7), color="black")
-    # filter out the images that are not in the run
-    # 1) extract the items from the sequences
-    amodal_items = []
-    for seq in amodal_sequences.values():
-        for item in seq:
-            amodal_items.append(item)
-    # 2) get the paths of the images that are in the run
-    img_files = glob.glob(str(pm.input_dir) + f"/stims/{lang}/*/*img.png")
-    img_files = [img for img in img_files if Path(img).stem.split('_')[0] in amodal_items]
-    random.shuffle(img_files)
-    start_item_path = glob.glob(str(pm.input_dir) + f"/stims/{lang}/*/{start_item}_img.png")[0]
-    
-    start_item_index = img_files.index(start_item_path) # needed to fill the removed item's position with the dummy image
-    img_files.remove(start_item_path)
-    dummy_path = None
-    img_files.insert(start_item_index, dummy_path)
+    # reshuffle the images over newly jittered grid positions, the start item is shown next to the slots
+    start_idx = assets['item_idx'][sequence[0]]
+    order = grid.reset(bq.gen_img_positions(jitter=0.05), start_idx, start_pos=(-0.75, 0.4))
 
-    positions = bq.gen_img_positions(jitter=0.05)
-
-    start_item_img = visual.ImageStim(
-        win,
-        image=start_item_path,
-        pos=(-0.75, 0.4),
-        size=(pm.bq_img_size, pm.bq_img_size * aspect_ratio),
-    )
-
-    # define dictionaries for images and slots. This will allow us to keep track of what happens to them.
-    images = []
-    for i, img_path in enumerate(img_files):
-        # this dummy image is used to fill the blank left by the cue
-        if img_path is None: 
-            # create an invisible placeholder
-            img_stim = visual.ImageStim(win, image=None, opacity=0, pos=positions[i])
-            images.append({
-                "stim": img_stim,
-                "highlight": visual.Rect(win, opacity=0),  # never shown
-                "orig_pos": positions[i],
-                "selected": False,
-                "placed": True,  # prevent interaction
-                "current_slot": None,
-            })
-            continue
-        img_stim = visual.ImageStim(
-            win,
-            image=img_path,
-            pos=positions[i],
-            size=(pm.bq_img_size, pm.bq_img_size * aspect_ratio),
-        )
-        highlight = visual.Rect(
-            win,
-            width=pm.bq_hl_size,
-            height=pm.bq_hl_size * aspect_ratio,
-            pos=positions[i],
-            lineColor="blue",
-            lineWidth=5,
-            opacity=0,
-        )
-        images.append(
-            {
-                "stim": img_stim,
-                "highlight": highlight,
-                "orig_pos": positions[i],
-                "selected": False,
-                "placed": False,
-                "current_slot": None,
-            }
-        )
-
-    slot_positions = [(-0.45, 0.4), (-0.15, 0.4), (0.15, 0.4), (0.45, 0.4), (0.75, 0.4)]
-    slots = [
-        {
-            "rect": visual.Rect(
-                win,
-                width=pm.bq_img_size,
-                height=pm.bq_img_size * aspect_ratio,
-                pos=pos,
-                lineColor="black",
-                fillColor=(105, 105, 105),
-            ),
-            "occupied": False,
-            "image": None,
-        }
-        for pos in slot_positions
-    ]
+    # grid position -> slot and slot -> grid position are kept in arrays, see bq.BonusState
+    start_pos_idx = int(np.flatnonzero(order == start_idx)[0])
+    state = bq.BonusState(len(order), len(assets['slot_positions']), rows=6, cols=6, blocked=[start_pos_idx])
 
     grid_index = 0
-    grid_cols = 6  # 6 columns as in gen_img_positions
-    selected_image = None  # Track the currently selected image
     running = True
     direct_d = {pm.key_bq[key]:key for key in ['left', 'right', 'up', 'down']} # invert key values and subselect directions    
-    event.clearEvents()
+    tools['clear_event_fun']()
+    grid_pos = np.argsort(order) # grid position of each image
+    fl.expect(tools, 'bonus', state=state, targets=[grid_pos[assets['item_idx'][item]] for item in sequence[1:]])
 
     while running:
+        grid.set_cursor(None if state.is_placed(grid_index) else order[grid_index])
+
         background.draw()
         instr2.draw()
-        start_item_img.draw()
-
-        for i, img in enumerate(images):
-            img["highlight"].opacity = 1 if i == grid_index and not img["placed"] else 0
-
-        # Draw slots (only the empty ones)
-        for slot in slots:
-            if not slot["occupied"]:
-                slot["rect"].draw()
-
-        # Draw all images (whether placed or not)
-        for img in images:
-            img["stim"].draw()
-            img["highlight"].draw()
+        grid.draw()
 
         # Update the window
         win.flip()
 
-        keys = event.getKeys()
+        keys = event_fun()
         for key in keys:
-            if key in list(direct_d.keys()): 
-                grid_index = bq.move_cursor(grid_index, direct_d[key], len(images), grid_cols, images)
+            if key in direct_d: 
+                grid_index = state.move_cursor(grid_index, direct_d[key])
             elif key == pm.key_bq['confirm']:
-                selected_image = bq.handle_select_or_place(images, grid_index, selected_image, slots)
-            # elif key == pm.key_bq['remove']: # TODO: fix it
-            #     bq.handle_undo(images)
-        occ_count = bq.count_occupied_slots(slots)
-        txt_instr3 = it.get_txt(lang, 'instr_bonus3_fn')
+                bq.handle_select_or_place(grid, state, order, grid_index)
+            elif key == pm.key_bq['remove']:
+                bq.handle_undo(grid, state, order)
         # check if the participant has placed all images and if so, save the data
         running = bq.check_slot_filling(
-            start_item_img, 
-            images, 
-            slots, 
-            occ_count, 
+            grid,
+            state,
+            order,
             win, 
             background, 
             out_path, 
-            txt_instr3,
+            assets['validate'],
             key_map=pm.key_bq,
             adapt_waitKeys=tools['adapt_waitKeys']
         )
 
         # if "escape" in event.getKeys():
         #     running = False
-        
-        core.wait(0.01) 
-    event.clearEvents()
+    tools['clear_event_fun']()
     if logger:
         logger.info(f"Bonus question: sequence {seq_name} completed")
     
@@ -249,15 +185,15 @@ def ask_all_seq(tools:dict):
     background.draw()
     instructions.draw()
     win.flip()
+    assets = get_bonus_assets(amodal_sequences, tools) # built while the instructions are on screen
     adapt_waitKeys(keyList=pm.key_bq['confirm'])
 
     for seq in amodal_sequences:
         seq_name = seq[0]
-        start_item = amodal_sequences[seq][0]
         ask_sequence(
-            start_item, 
+            amodal_sequences[seq], 
             seq_name=seq_name, 
-            amodal_sequences=amodal_sequences,
+            assets=assets,
             tools=tools,
         )
         
@@ -388,7 +324,7 @@ def display_rwd_amt(tools, reward_amount):
     background.draw()
     reward_text.draw()
     win.flip()
-    core.wait(5)
+    tools['wait_fun'](5)
 
     if logger:
         logger.info("=============== End of bonus question ===============")
@@ -424,6 +360,9 @@ if __name__ == "__main__":
         'aspect_ratio': win_dict['aspect_ratio'],
         'logger': None,
         'adapt_waitKeys':adapt_waitKeys,
+        'wait_fun': fl.scaled_wait(core.wait, 1),
+        'event_fun': event.getKeys,
+        'clear_event_fun': event.clearEvents,
     }
     ask_all_seq(tools) 
     rwd, n_corr = cpt_reward_feedback(tools)
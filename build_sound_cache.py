@@ -0,0 +1,73 @@
+import os
+import json
+import argparse
+from math import gcd
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+from sequences import params as pm
+from sequences.assets import hash_file
+from sequences.sounds import session_sound_paths
+
+# This script converts the sounds of the session to the format of the audio device (sample rate and channels) once,
+# so the stream opened for each sound plays the samples as they are. The converted files are float32 WAVs named by
+# the digest of their source, the SoundBank picks them up when they exist. Run it again when the device changes.
+
+manifest_name = 'manifest.json'
+
+def device_format(device:int=None)-> dict:
+    ''' Default sample rate and number of output channels (at most 2) of an output device'''
+    import sounddevice as sd # only needed to build the cache
+    info = sd.query_devices(device, kind='output')
+    return {'sample_rate': int(info['default_samplerate']), 'channels': min(int(info['max_output_channels']), 2)}
+
+def convert(signal:np.ndarray, rate:int, sample_rate:int, channels:int)-> np.ndarray:
+    ''' Scale a WAV signal to [-1, 1] float32, resample it and map it to the number of channels'''
+    if np.issubdtype(signal.dtype, np.unsignedinteger): # e.g. 8-bit WAVs, centered on the middle of the range
+        mid = (int(np.iinfo(signal.dtype).max) + 1) / 2
+        signal = (signal - mid) / mid
+    elif np.issubdtype(signal.dtype, np.integer):
+        signal = signal / np.iinfo(signal.dtype).max
+    signal = signal.astype(np.float32)
+    if signal.ndim == 1:
+        signal = signal[:, np.newaxis]
+    if rate != sample_rate:
+        div = gcd(rate, sample_rate)
+        signal = resample_poly(signal, sample_rate // div, rate // div, axis=0).astype(np.float32)
+    if signal.shape[1] != channels:
+        signal = np.repeat(signal.mean(axis=1, keepdims=True), channels, axis=1) # down/upmix through mono
+    return np.ascontiguousarray(np.clip(signal, -1, 1))
+
+def build_cache(paths:list=None, cache_dir:str=pm.snd_cache_dir, fmt:dict=None)-> dict:
+    ''' Convert the sounds that are not cached yet in this format. Returns the manifest (format and source digests).'''
+    if paths is None:
+        paths = session_sound_paths()
+    if fmt is None:
+        fmt = device_format()
+    manifest_fn = os.path.join(cache_dir, manifest_name)
+    manifest = {'format': fmt, 'sources': {}}
+    if os.path.exists(manifest_fn):
+        with open(manifest_fn, 'r') as f:
+            old = json.load(f)
+        if old['format'] == fmt: # a different format invalidates all the files
+            manifest = old
+    os.makedirs(cache_dir, exist_ok=True)
+    n_converted = 0
+    for path in paths:
+        digest = hash_file(path)
+        out = os.path.join(cache_dir, f'{digest}.wav')
+        if manifest['sources'].get(str(path)) != digest or not os.path.exists(out):
+            rate, signal = wavfile.read(path)
+            wavfile.write(out, fmt['sample_rate'], convert(signal, rate, fmt['sample_rate'], fmt['channels']))
+            n_converted += 1
+        manifest['sources'][str(path)] = digest
+    with open(manifest_fn, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    print(f"{n_converted} sounds converted to {fmt['sample_rate']} Hz / {fmt['channels']} ch, {len(paths) - n_converted} up to date")
+    return manifest
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the session sounds to the format of the audio device')
+    parser.add_argument('--device', type=int, default=None, help='output device index (default device if not given)')
+    args = parser.parse_args()
+    build_cache(fmt=device_format(args.device))
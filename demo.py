@@ -27,7 +27,7 @@ def init_run():
     'win': win_dict['win'],
     'aspect_ratio': win_dict['aspect_ratio'],
     'background': win_dict['background'],
-    'wait_fun': core.wait,
+    'wait_fun': fl.scaled_wait(core.wait, 1),
     'event_fun': event.getKeys,
     'clear_event_fun':event.clearEvents,
     'exp_info': exp_info,
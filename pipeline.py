@@ -3,26 +3,28 @@ import sys
 import shutil
 import logging
 import glob
-import time
 import random
-import math
 import pandas as pd
 import numpy as np
 import byte_triggers as bt
 import platform
 from datetime import datetime
+from collections import deque
 from psychopy.gui import DlgFromDict
 from psychopy.hardware.keyboard import Keyboard
 from psychopy import visual, core, event #, sound
-from stimuli.audio import Sound
 from sequences import stimuli_manager as sm
 from sequences import flow as fl
 from sequences import params as pm
 from sequences import instr as it
-from sequences.common import get_win_dict
+from sequences.common import get_win_dict, build_static_layer
+from sequences.prefetch import StimPrefetcher
+from sequences.assets import AssetStore
+from sequences.sounds import SoundBank, SequenceTrack, TrackPlayer, session_sound_paths, sound_format
+from sequences.presentation import PresentationPool, QuestionScreen, FrameEngine, SpriteSheet, TextCache, measure_frate, flicker_table
 from bonus_question import bonus_question
 
-def execute_run(debugging=False):
+def execute_run(debugging=False, participant=None):
     ''' Main function, it executes a run of the experiment. Need to be called twice for the full experiment.
 
     Parameters
@@ -35,7 +37,7 @@ def execute_run(debugging=False):
     tools : dict
         Dictionary containing the tools needed for the experiment (needed to transfer the window to the bonus questions).
     '''
-    tools = initialize_run(debugging) # seed is set here. Tools contains a lot of useful stuff, including the tracker.
+    tools = initialize_run(debugging, participant) # seed is set here. Tools contains a lot of useful stuff, including the tracker.
     logger = tools['logger']
     exp_info = tools['exp_info']
     # Generate the multimodal sequences of items and the organization of the modality for presenation and questions
@@ -46,6 +48,7 @@ def execute_run(debugging=False):
 
     sound_org = sm.distribute_snd(seq_names=list(amodal_sequences.keys()), snd_dir=pm.snd_stim_dir, seed=tools['seed']) # get the sound organization for the sequences
     tools['sound_org'] = sound_org 
+    tools['amodal_sequences'] = amodal_sequences # kept for the screens after the run (rewarded sequences)
     two_run_org = sm.generate_run_org(amodal_sequences, seed=tools['seed']) # get the global oorganization of sequences for the two runs
     run_org = two_run_org[f'run{int(exp_info["run"])}'] # get the organization of sequences for the current run
 
@@ -95,6 +98,10 @@ def execute_run(debugging=False):
             )
             
         logger.info(f'Run {tools["exp_info"]["run"]} completed successfully.')
+        logger.info(f'presentation pool: {tools["stim_pool"].stats()}')
+        logger.info(f'messages laid out during the run: {tools["texts"].misses}')
+        logger.info(f'sounds: {tools["sound_bank"].stats()}')
+        logger.info(f'errors of the predicted audio-visual onsets: {tools["engine"].av_stats()}')
         logger.info('=============== End of core part ===============')
 
         return tools
@@ -104,7 +111,7 @@ def execute_run(debugging=False):
             logger, 
             tools["win"])
         
-def initialize_run(debugging):
+def initialize_run(debugging, participant=None):
     ''' Initializes a run. Creates the output dir, set or get the seed to control randomization and 
     returns a dictionary containing the tools needed for the experiment (window, pport etc).
     '''
@@ -182,10 +189,27 @@ def initialize_run(debugging):
     logger.info(f'Run number: {exp_info["run"]}')
     logger.info(f'Language: {exp_info["lang"]}')
 
-    reward_max = Sound(pm.sound0_fn)
-    q_reward_sounds = [Sound(fn) for fn in pm.q_reward_fn]
+    it.load_registry() # all the instruction texts are read once here
+    asset_store = AssetStore()
+    asset_store.index_catalogs(pm.input_dir) # identical stimuli of different languages share one entry
+    logger.info(f'Stimulus files: {asset_store.stats()}')
+    sound_paths = session_sound_paths()
+    sound_bank = SoundBank(sound_paths, cache_dir=pm.snd_cache_dir) # every sound is decoded once for the session
+    logger.info(f'Sounds: {sound_bank.stats()}')
+    # one output stream for the pre-mixed tracks of the whole run, in the format of the sequence sounds (listed first)
+    track_player = TrackPlayer(*sound_format(sound_bank.get(sound_paths[0])))
+    logger.info(f'Track stream latency: {track_player.latency:.4f} s')
+    reward_max = sound_bank.get(pm.sound0_fn)
+    q_reward_sounds = [sound_bank.get(fn) for fn in pm.q_reward_fn]
     win_dict = get_win_dict()
     win_dict['win'].mouseVisible = False
+    frate = measure_frate(win_dict['win'])
+    time_scale = pm.debug_time_scale if debugging else pm.time_scale
+    engine = FrameEngine(win_dict['win'], frate, time_scale, # durations are presented as frame counts
+        audio_latency=max(pm.audio_latency, track_player.latency))
+    logger.info(f'Refresh rate: {frate:.2f} Hz')
+    logger.info(f'Time scale: {time_scale}')
+    logger.info(f'Durations in frames: {engine.frames}')
 
     # define the tracker to keep track of where we are in the experiment
     tracker = { 
@@ -199,6 +223,7 @@ def initialize_run(debugging):
 
     tools = {
         'debugging': debugging,
+        'time_scale': time_scale,
         'pport': pport,
         'logger': logger,
         'win': win_dict['win'],
@@ -209,6 +234,8 @@ def initialize_run(debugging):
         'trig_fun': pport.signal,
         'clear_event_fun':event.clearEvents,
         'exp_info': exp_info,
+        'sound_bank': sound_bank,
+        'track_player': track_player,
         'q_reward_sounds': q_reward_sounds,
         'reward_max': reward_max,
         'seed': seed,
@@ -217,10 +244,66 @@ def initialize_run(debugging):
         'tracker': tracker,
         'keyboard': keyboard,
         'adapt_waitKeys': adapt_waitKeys,
+        'asset_store': asset_store,
+        'prefetcher': StimPrefetcher(store=asset_store),
+        'stim_pool': PresentationPool(win_dict['win'], win_dict['aspect_ratio']),
+        'question_screen': QuestionScreen(win_dict['win'], win_dict['aspect_ratio']),
+        'engine': engine,
+        'deferred': deque(), # work run during the breaks, see fl.defer
+        'texts': build_text_cache(win_dict['win'], exp_info['lang']),
+        'participant': None,
     }
+    if participant is not None: # simulated participant, the input and the waits go through it
+        tools.update(participant.tools())
+        participant.time_scale = time_scale
+        logger.info(f'Simulated participant: {type(participant).__name__}')
+    tools['wait_fun'] = fl.scaled_wait(tools['wait_fun'], time_scale) # every wait of the session goes through the time scale
     
     return tools
 
+# TextStim arguments of the instruction messages, on top of the TextCache defaults (font '' is the psychopy default)
+text_styles = {
+    'quest_ready': {},
+    'quest': {'font': '', 'pos': (0, 0.5)},
+    'scale_left': {'font': '', 'pos': (pm.far_l, pm.y_bar+pm.stxt_up)},
+    'scale_right': {'font': '', 'pos': (pm.far_r, pm.y_bar+pm.stxt_up)},
+    'block_pause': {'font': '', 'pos': (0, 0.5)},
+    'run_pause': {'font': '', 'pos': (0, 0.55)},
+    'tmr': {'font': ''},
+    'instr_q': {'font': '', 'pos': (0, 0.55)},
+    'reward': {'font': '', 'pos': (0, 0.85)},
+}
+
+def build_text_cache(win, lang:str)-> TextCache:
+    ''' Lay out the messages of the session once: question feedback, trial feedback, block messages, questionnaires
+    and instructions'''
+    texts = TextCache(win)
+    for distance in ['NA', 0, 1]:
+        feedback_txt, font_color, _, _ = sm.get_feedback_args(distance, lang=lang)
+        texts.add(feedback_txt, color=font_color, bold=True)
+    for block_id in range(1, pm.n_blocks+1):
+        texts.add(sm.get_block_start_txt(block_id, lang=lang))
+        for n_points in range(pm.max_points+1):
+            trial_feedback = sm.get_trial_feedback(n_points=n_points, max_points=pm.max_points, lang=lang)
+            for end_of_block in [False, True]:
+                block_info = sm.get_block_info_txt(block_id, end_of_block=end_of_block, lang=lang)
+                texts.add(f"{trial_feedback} \n{block_info}", alignText="center")
+    for instr_fn in ['instr1_fn', 'instr2_fn']:
+        texts.add(it.get_txt(lang, instr_fn), alignText="center")
+    texts.add(it.get_txt(lang, 'quest_ready_fn'), **text_styles['quest_ready'])
+    for quest in ['vigi', 'focus', 'think']:
+        texts.add(it.get_txt(lang, f'quest_{quest}_fn'), **text_styles['quest'])
+        st1, st2 = pm.stxt_dict[lang][quest]
+        texts.add(st1, **text_styles['scale_left'])
+        texts.add(st2, **text_styles['scale_right'])
+    for style in ['block_pause', 'run_pause']:
+        texts.add(it.get_txt(lang, 'instr_pause_fn'), **text_styles[style])
+    for instr_fn in ['instr_tmr1', 'instr_tmr2']:
+        texts.add(it.get_txt(lang, instr_fn), **text_styles['tmr'])
+    texts.add(it.get_txt(lang, 'instr_q_fn'), **text_styles['instr_q'])
+    texts.add(it.get_txt(lang, 'instr_reward_fn'), **text_styles['reward'])
+    return texts
+
 def execute_block(tools, amodal_sequences, question_mod_org, first_seq_mod_org, block_org):
     ''' Executes a full block: sequence presentation and questioning. Returns the updated tracker.
     
@@ -256,19 +339,25 @@ def execute_block(tools, amodal_sequences, question_mod_org, first_seq_mod_org,
 
     for j in range(n_skip+1, pm.n_trials+1): # +1 because we want to include the last trial and start from 1.
         tools['tracker']['trial_id'] = j
-        seq_sounds = {seq_n:Sound(path) for seq_n, path in tools['sound_org'].items()} # sounds are loaded here
-        #seq_sounds = None
+        seq_sounds = tools['sound_bank'].get_all(tools['sound_org']) # decoded at startup
         trial_seq_org, trial_mod_org = initialize_trial_sequences(
             tools=tools,
             first_seq_mod_org=first_seq_mod_org,
             block_org=block_org
         )
+        question_stims = get_question_stims(
+            tools=tools,
+            amodal_sequences=amodal_sequences,
+            trial_seq_org=trial_seq_org,
+            question_mod_org=question_mod_org
+        )
         present_sequences(
             tools=tools,
             amodal_sequences=amodal_sequences, 
             trial_seq_org=trial_seq_org, 
             trial_mod_org=trial_mod_org,
             seq_sounds=seq_sounds,
+            question_stims=question_stims,
         )
                             
         tools = handle_questioning(
@@ -306,18 +395,7 @@ def initialize_block(tools, run_org):
     logger.info(f'block: {tracker["block_id"]}')
     logger.info(f'sequences: {chosen_sequences}')
 
-    if tools['exp_info']['lang'] == 'fr':
-        txt = f"Bloc {tracker['block_id']} \nAttendez le feu vert de l'experimentateur, puis appuyez sur le bouton central pour commencer!"
-    else:
-        txt = f"Block {tracker['block_id']} \nWait for the experimenter's signal, then press the middle key to start!"
-    block_info = visual.TextStim(win=win,
-        text=txt,
-        pos=(0, 0),
-        font="Arial",
-        color='black', 
-        height=pm.text_height,
-        units='norm'
-    )
+    block_info = tools['texts'].get(sm.get_block_start_txt(tracker['block_id'], lang=tools['exp_info']['lang']))
                 
     background.draw()
     block_info.draw()
@@ -336,14 +414,7 @@ def end_block_break_quest(tools):
 
     # small waitkeys so the participant doesn't click automatically for the questionnaire
     instr_txt = it.get_txt(tools['exp_info']['lang'], 'quest_ready_fn')
-    instr = visual.TextStim(win=win,
-        text=instr_txt,
-        pos=(0, 0),
-        font="Arial",
-        color='black', 
-        height=pm.text_height,
-        units='norm'
-    )
+    instr = tools['texts'].get(instr_txt, **text_styles['quest_ready'])
     background.draw()
     instr.draw()
     win.flip()
@@ -399,29 +470,9 @@ def present_questionnaire(tools, text, scale_text1, scale_text2):
     slider_pos = np.linspace(pm.far_l, pm.far_r, pm.n_ticks)
     start_pos = int(np.floor(pm.n_ticks / 2)) # start in the middle
 
-    txt = visual.TextStim(
-        win,
-        text=text,
-        height=pm.text_height,
-        pos=(0, 0.5),
-        color="black",
-    )
-
-    s1 = visual.TextStim(
-        win,
-        text=scale_text1,
-        height=pm.text_height,
-        pos=(pm.far_l, pm.y_bar+pm.stxt_up),
-        color="black",
-    )
-
-    s2 = visual.TextStim(
-        win,
-        text=scale_text2,
-        height=pm.text_height,
-        pos=(pm.far_r, pm.y_bar+pm.stxt_up),
-        color="black",
-    )
+    txt = tools['texts'].get(text, **text_styles['quest'])
+    s1 = tools['texts'].get(scale_text1, **text_styles['scale_left'])
+    s2 = tools['texts'].get(scale_text2, **text_styles['scale_right'])
 
     bar = visual.Rect(
         win,
@@ -450,75 +501,71 @@ def present_questionnaire(tools, text, scale_text1, scale_text2):
         for x in slider_pos
     ]
 
+    # everything but the slider is composited once
+    static_layer = build_static_layer(win, [background, txt, s1, s2, bar] + ticks)
+
     def draw_all():
-        background.draw()
-        txt.draw()
-        s1.draw()
-        s2.draw()
-        bar.draw()
-        for tick in ticks:
-            tick.draw()
+        static_layer.draw()
         slider.draw()
 
     draw_all()
     win.flip()
 
+    fl.expect(tools, 'likert', n_ticks=pm.n_ticks, start=start_pos)
     current_pos = start_pos
     run = True
     while run:
-        keys = event.getKeys()
+        keys = tools['event_fun']()
         if pm.key_dict['confirm'] in keys:
             run = False
-        current_pos = sm.move_slider(slider, slider_pos, pm.y_bar, current_pos, keys, pm.key_dict)
-        draw_all()
-        win.flip()
-        core.wait(0.001)
+        new_pos = sm.move_slider(slider, slider_pos, pm.y_bar, current_pos, keys, pm.key_dict)
+        if new_pos != current_pos: # only redraw when the slider moved
+            current_pos = new_pos
+            draw_all()
+            win.flip()
+        else:
+            tools['wait_fun'](pm.t_poll, scale=False, hogCPUperiod=0)
 
     slider.fillColor = pm.validation_c
     draw_all()
     win.flip()
-    core.wait(0.5)
+    tools['wait_fun'](0.5)
     background.draw()
     win.flip()
-    core.wait(1.5)
+    tools['wait_fun'](1.5)
 
     return current_pos+1
 
+def get_spin_wheel(tools):
+    ''' Sprite sheet of the spinning wheel, built at the first break and kept for the next ones'''
+    if 'spin_wheel' not in tools:
+        w_fns = sorted(glob.glob(f'{pm.spin_wheel_dir}/w*.png'))
+        tools['spin_wheel'] = SpriteSheet(tools['win'], w_fns, size=(0.2, 0.2*tools['aspect_ratio']))
+    return tools['spin_wheel']
+
 def post_block_break(tools):
     ''' Function to present a break between blocks. Returns nothing. '''
     win = tools['win']
     background = tools['background']
-    aspect_ratio = tools['aspect_ratio']
     logger = tools['logger']
     pport = tools['pport']
     block_id = tools['tracker']['block_id']
 
     text = it.get_txt(tools['exp_info']['lang'], 'instr_pause_fn')
-    instr = visual.TextStim(
-        win=tools['win'],
-        text=text,
-        pos=(0, 0.5),
-        height=pm.text_height,
-        color='black',
-        units='norm'
-    ) 
-
-    # load spinning wheel images 
-    w_fns = sorted(glob.glob(f'{pm.spin_wheel_dir}/w*.png'))
-    w_imgs = [
-        visual.ImageStim(win, image=w_fn, size=(0.2, 0.2*aspect_ratio), units="norm")
-        for w_fn in w_fns
-    ]
-    wclock = core.Clock()
-    rclock = core.Clock()
+    instr = tools['texts'].get(text, **text_styles['block_pause'])
+
+    wheel = get_spin_wheel(tools)
     # log and triggers before and after break
     logger.info(f'block {block_id} break start')
-    background.draw()
-    instr.draw()
+    static_layer = build_static_layer(win, [background, instr])
+    static_layer.draw()
     win.callOnFlip(pport.signal, pm.triggers['misc']['block_pause'])
     win.flip()
 
-    sm.display_wheel(tools, wclock, rclock, pm.t_post_block, pm.t_rotate, w_imgs, instr)
+    engine = tools['engine']
+    fl.defer(tools, fl.flush_logs, logger)
+    n_done = sm.display_wheel(tools, engine.frames['t_post_block'], engine.frames['t_rotate'], wheel, [static_layer])
+    logger.info(f'{n_done} deferred tasks run during the break')
 
     pport.signal(pm.triggers['misc']['block_endpause'])
     logger.info(f'block {block_id} break stop')
@@ -531,46 +578,34 @@ def post_run_break(tools, pause_i):
     logger = tools['logger']
     win = tools['win']
     background = tools['background']
-    aspect_ratio = tools['aspect_ratio']
 
     # for the questionnaire about thinking about sequences
     think_text = it.get_txt(tools['exp_info']['lang'], 'quest_think_fn')
     st1, st2 = pm.stxt_dict[tools['exp_info']['lang']]['think'] 
 
     # sound indicating the end of the break
-    end_sound = Sound(pm.snd_endPause_fn)
+    end_sound = tools['sound_bank'].get(pm.snd_endPause_fn)
     # intructions
     text = it.get_txt(tools['exp_info']['lang'], 'instr_pause_fn')
-    instr = visual.TextStim(
-        win=tools['win'],
-        text=text,
-        pos=(0, 0.55),
-        height=pm.text_height,
-        color='black',
-        units='norm'
-    ) 
-    # load spinning wheel images 
-    w_fns = sorted(glob.glob(f'{pm.spin_wheel_dir}/w*.png'))
-    w_imgs = [
-        visual.ImageStim(win, image=w_fn, size=(0.2, 0.2*aspect_ratio), units="norm")
-        for w_fn in w_fns
-    ]
-    wclock = core.Clock()
-    rclock = core.Clock()
+    instr = tools['texts'].get(text, **text_styles['run_pause'])
+    wheel = get_spin_wheel(tools)
     # log and triggers before and after break
     logger.info(f'post run break {pause_i} start')
-    background.draw()
-    instr.draw()
+    static_layer = build_static_layer(win, [background, instr])
+    static_layer.draw()
     win.callOnFlip(pport.signal, pm.triggers['misc']['run_pause'])
     win.flip()
 
-    sm.display_wheel(tools, wclock, rclock, pm.t_post_run, pm.t_rotate, w_imgs, instr)
+    engine = tools['engine']
+    fl.defer(tools, fl.flush_logs, logger)
+    n_done = sm.display_wheel(tools, engine.frames['t_post_run'], engine.frames['t_rotate'], wheel, [static_layer])
+    logger.info(f'{n_done} deferred tasks run during the break')
 
     background.draw()
     instr.draw()
     win.callOnFlip(end_sound.play)
     win.flip()
-    core.wait(1) # wait for the sound to finish
+    tools['wait_fun'](1) # wait for the sound to finish
     pport.signal(pm.triggers['misc']['run_endpause'])
     logger.info(f'post run break {pause_i} end')
     logger.info('Asking the think question')
@@ -593,25 +628,11 @@ def play_tmr(tools):
 
     # load instruction part
     text = it.get_txt(tools['exp_info']['lang'], 'instr_tmr1')
-    instr1 = visual.TextStim(
-        win=tools['win'],
-        text=text,
-        pos=(0, 0),
-        height=pm.text_height,
-        color='black',
-        units='norm'
-    ) 
+    instr1 = tools['texts'].get(text, **text_styles['tmr'])
     # load tmr part
-    s_dict = {seq_n:Sound(fn) for seq_n, fn in tools['sound_org'].items()}
+    s_dict = tools['sound_bank'].get_all(tools['sound_org'])
     text = it.get_txt(tools['exp_info']['lang'], 'instr_tmr2')
-    instr2 = visual.TextStim(
-        win=tools['win'],
-        text=text,
-        pos=(0, 0),
-        height=pm.text_height,
-        color='black',
-        units='norm'
-    ) 
+    instr2 = tools['texts'].get(text, **text_styles['tmr'])
 
     # flow
     background.draw()
@@ -619,21 +640,16 @@ def play_tmr(tools):
     win.flip()
     adapt_waitKeys(keyList=[pm.key_dict['confirm']])
 
-    background.draw()
-    instr2.draw()
-    win.flip()
+    engine = tools['engine']
     logger.info('Starting TMR')
-    core.wait(pm.t_tmr_delay)
+    engine.present([background, instr2], engine.frames['t_tmr_delay'])
 
     for seq_n, snd in s_dict.items():
         logger.info(f"playing {tools['sound_org'][seq_n]} for sequence {seq_n}")
         jitter = random.choice([-pm.tmr_jitter, 0, pm.tmr_jitter])
         win.callOnFlip(pport.signal, pm.triggers['misc'][f'tmr_{seq_n}'])        
         win.callOnFlip(snd.play)
-        background.draw()
-        instr2.draw()
-        win.flip()
-        core.wait(pm.t_tmr_delay+jitter)
+        engine.present([background, instr2], engine.n_frames(pm.t_tmr_delay+jitter))
 
     logger.info('TMR successfully done')
     return
@@ -660,26 +676,12 @@ def handle_questioning(tools, amodal_sequences, trial_seq_org, question_mod_org)
     tracker = tools['tracker'] # I extract it here, and it is reasigned in tools at the end of the function
     tracker['points_attributed'] = 0 # reset points for each trial
     question_modalities = question_mod_org[f'block{tracker["block_id"]}'][f'trial{tracker["trial_id"]}']
-    t_prep = pm.t_prep
-    t_iqi = pm.t_iqi
-    if tools['debugging']:
-        t_prep = 0.01
-        t_iqi = 0.01
     
     text = it.get_txt(tools['exp_info']['lang'], 'instr_q_fn')
-    instructions = visual.TextStim(
-        win=tools['win'],
-        text=text,
-        pos=(0, 0.55),
-        height=pm.text_height,
-        color='black',
-        units='norm'
-    ) 
-
-    tools['background'].draw()
-    instructions.draw()
-    tools['win'].flip()
-    core.wait(t_prep)
+    instructions = tools['texts'].get(text, **text_styles['instr_q'])
+
+    engine = tools['engine']
+    engine.present([tools['background'], instructions], engine.frames['t_prep'])
 
     for m, seq_name in enumerate(trial_seq_org[0:3]): # 3 questions per trial because 3 sequences presented twice
         tracker['question_id'] = m + 1
@@ -694,7 +696,7 @@ def handle_questioning(tools, amodal_sequences, trial_seq_org, question_mod_org)
         run_id = tools['exp_info']['run']
         subject_id = tools['exp_info']['ID']
         pd.DataFrame(tracker['data']).to_csv(f"{out_dir}/sub-{subject_id}_run-{run_id}.csv", index=False)
-        core.wait(t_iqi)
+        engine.present(engine.screen, engine.frames['t_iqi']) # the feedback stays on screen
                 
     # encouraging message
     provide_trial_feedback(
@@ -719,32 +721,20 @@ def present_instructions(tools):
         fl.check_escape_or_break(tools, pause_key=pm.key_dict['pause'])
         adapt_waitKeys(keyList=[pm.key_dict['confirm']])
 
-    if exp_info['lang'] == 'fr':
-        txt = "Nous allons présenter les instructions.\nAppuyez sur le bouton central pour continuer."
-    else:
-        txt = "We are going to present the instructions.\nPress the middle key to continue."
     if exp_info['run'] == '01': # only present the instructions at the first run
         fl.type_text(
-            text=txt,
+            text=sm.get_instr_intro_txt(exp_info['lang']),
             win=win,
             height=pm.text_height,
             background=background,
-            t=pm.t
+            t=fl.scale_dur(tools, pm.t),
         )
         adapt_waitKeys(keyList=[pm.key_dict['confirm']])
 
     instr1 = it.get_txt(exp_info['lang'], 'instr1_fn')
     instr2 = it.get_txt(exp_info['lang'], 'instr2_fn')
 
-    instr_objects = [visual.TextStim(
-        win,
-        text=instr, 
-        font="Arial", 
-        color='black',  
-        height=pm.text_height,
-        alignText="center" 
-        ) for instr in [instr1, instr2]
-    ]
+    instr_objects = [tools['texts'].get(instr, alignText="center") for instr in [instr1, instr2]]
 
     for instr in instr_objects:
         present(instr)
@@ -810,7 +800,6 @@ def ask_trial_question(tools, tracker, amodal_sequences, question_modalities, se
     #TODO: check tracker
 
     win = tools['win']
-    aspect_ratio = tools['aspect_ratio']
     background = tools['background']
     logger = tools['logger']
     exp_info = tools['exp_info']
@@ -857,76 +846,21 @@ def ask_trial_question(tools, tracker, amodal_sequences, question_modalities, se
     logger.info(f"second item's index: {idx2}")
     logger.info(f"second item's category: {cat2}")
                         
-    slot_positions = sm.get_slot_pos(y_pos=pm.y_pos)
-    slots = [
-        {
-            "rect": visual.Rect(
-                win,
-                width=pm.q_slot_size,
-                height=pm.q_slot_size * aspect_ratio,
-                pos=pos,
-                lineColor="black",
-                fillColor=(105, 105, 105)),
-            "highlight": visual.Rect(
-                win,
-                width=pm.hl_size,
-                height=pm.hl_size * aspect_ratio,
-                pos=pos,
-                lineColor="blue",
-                lineWidth=5,
-                opacity=0,
-            ),
-            "selected": False,
-        }
-        for pos in slot_positions
-    ]
-
-    cue_viz = visual.ImageStim(
-        win,
-        image=stims[idx1],
-        pos=(0, 0),
-        size=(pm.img_size, pm.img_size * aspect_ratio),
-    )
-    cue_seq = visual.ImageStim(
-        win,
-        image=stims[idx1],
-        pos=(-0.75, pm.y_pos),
-        size=(pm.q_img_size, pm.q_img_size * aspect_ratio),
-    )
-    target_viz = visual.ImageStim(
-        win,
-        image=stims[idx2],
-        pos=(0, 0),
-        size=(pm.img_size, pm.img_size * aspect_ratio),
-    ) 
-    target_seq = visual.ImageStim(
-        win,
-        image=stims[idx2],
-        pos=(0, -pm.y_pos),
-        size=(pm.q_img_size, pm.q_img_size * aspect_ratio),
-    )
-
-    # rectangle for photodiode
-    rect = visual.Rect(
-        win=win,
-        width=0.1,
-        height=0.1*aspect_ratio,
-        pos=(1, 1),
-        units='norm',
-        fillColor=(255, 255, 255),
-    )
+    # the widgets are built once with the window, only the images (decoded in the background) change here
+    q_screen = tools['question_screen']
+    q_screen.prepare(tools['prefetcher'].get(stims[idx1]), tools['prefetcher'].get(stims[idx2]))
+    slots = q_screen.slots
+    cue_viz, cue_seq = q_screen.cue_viz, q_screen.cue_seq
+    target_viz, target_seq = q_screen.target_viz, q_screen.target_seq
+    rect = q_screen.rect # rectangle for photodiode
+    # background, slots and start item do not change during the response
+    static_layer = build_static_layer(win, [background] + [slot["rect"] for slot in slots] + [cue_seq])
 
     rt_clock = core.Clock()
     fade_clock = core.Clock()
+    engine = tools['engine']
     t_viz_cue = pm.t_viz_cue
-    t_viz_target = pm.t_viz_target
-    t_act = pm.t_act
-    t_fb = pm.t_fb
-    if tools['debugging']:
-        t_viz_cue = 0.01
-        t_viz_target = 0.01
-        t_act = 0.01
-        t_fb = 0.01
+    t_act = fl.scale_dur(tools, pm.t_act) # timeout measured with a clock
 
     background.draw()
     cue_viz.draw()
@@ -935,13 +869,10 @@ def ask_trial_question(tools, tracker, amodal_sequences, question_modalities, se
     win.flip()
     sm.fade_out(tools, cue_viz, clock=fade_clock, f_dur=t_viz_cue)
 
-    background.draw()
-    target_viz.draw()
-    rect.draw()
     win.callOnFlip(fl.novov_trigger,pport=pport, trig1=triggers1[1], trig2=triggers2[1], delay=10)
-    win.flip()
-    core.wait(t_viz_target)
+    engine.present([background, target_viz, rect], engine.frames['t_viz_target'])
 
+    fl.expect(tools, 'question', answer=idx2-1, n_slots=len(slots)) # the first item is not selectable
     resp_idx, rt = sm.run_question(
         tools=tools,
         slots=slots,
@@ -951,7 +882,9 @@ def ask_trial_question(tools, tracker, amodal_sequences, question_modalities, se
         global_clock=core.Clock(),
         t_act=t_act,
         key_dict=pm.key_dict,
-        trig_dict=pm.triggers
+        trig_dict=pm.triggers,
+        static_layer=static_layer,
+        t_poll=pm.t_poll,
     )
 
     distance = sm.get_response_distance(resp_idx, idx2, rt)
@@ -961,25 +894,12 @@ def ask_trial_question(tools, tracker, amodal_sequences, question_modalities, se
 
     fl.check_escape_or_break(tools, pause_key=pm.key_dict['pause'])
 
-    feedback = visual.TextStim(win=win,
-        text=feedback_txt,
-        pos=(0, 0),
-        font="Arial",
-        color=font_color, 
-        height=pm.text_height,
-        units='norm',
-        bold=True
-    )
+    feedback = tools['texts'].get(feedback_txt, color=font_color, bold=True)
      
     reward_sound = sm.get_fb_sound(tools['q_reward_sounds'], n_points)
                         
-    background.draw()
-    feedback.draw()
     win.callOnFlip(tools['pport'].signal, pm.triggers['misc'][fb_trig])
-    win.flip()
-    if reward_sound:
-        reward_sound.play()
-    core.wait(t_fb)
+    engine.present([background, feedback], engine.frames['t_fb'], task=reward_sound.play if reward_sound else None)
     date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     tracker['data'].append({
         'ID': exp_info['ID'],
@@ -1038,10 +958,6 @@ def initialize_trial_sequences(tools, first_seq_mod_org, block_org):
 def provide_trial_feedback(tools, tracker):
     ''' Provide feedback at the end of a trial. Returns nothing. '''
 
-    t_post_q = pm.t_post_q
-    if tools['debugging']:
-        t_post_q = 0.01
-
     # if tracker['points_attributed'] > 6:
     #     tools['reward_max'].play() 
     trial_feedback = sm.get_trial_feedback(
@@ -1050,37 +966,30 @@ def provide_trial_feedback(tools, tracker):
         lang=tools['exp_info']['lang']
     )
 
-    if tracker['trial_id'] == 3:
-        if tools['exp_info']['lang'] == 'fr':
-            block_info = f"Fin du bloc {tracker['block_id']}. \nRépondez aux questions suivantes et profitez d'une courte pause."
-        else:
-            block_info = f"End of block {tracker['block_id']}. \nAnswer the following questions and enjoy a short break."
-    else:
-        if tools['exp_info']['lang'] == 'fr':
-            block_info = "L'essai suivant va commencer."
-        else:
-            block_info = "The next trial will start."
-
-    txt =  f"{trial_feedback} \n{block_info}"
-    text_stim = visual.TextStim(
-        tools['win'], 
-        text=txt, 
-        font="Arial", 
-        color='black', 
-        height=pm.text_height,
-        alignText="center"
-    )    
-
-    tools['background'].draw()
-    text_stim.draw()
-    tools['win'].flip()
-    core.wait(t_post_q)
+    block_info = sm.get_block_info_txt(tracker['block_id'], end_of_block=tracker['trial_id'] == pm.n_trials, lang=tools['exp_info']['lang'])
+    text_stim = tools['texts'].get(f"{trial_feedback} \n{block_info}", alignText="center")
+
+    engine = tools['engine']
+    engine.present([tools['background'], text_stim], engine.frames['t_post_q'])
     return
 
-def present_sequences(tools, amodal_sequences, trial_seq_org, trial_mod_org, seq_sounds):
+def get_question_stims(tools, amodal_sequences, trial_seq_org, question_mod_org):
+    ''' Return the paths of all the stimuli that can be shown in the questions of the current trial.
+    Used to decode them in the background while the sequences are presented.'''
+    tracker = tools['tracker']
+    question_modalities = question_mod_org[f'block{tracker["block_id"]}'][f'trial{tracker["trial_id"]}']
+    question_stims = []
+    for m, seq_name in enumerate(trial_seq_org[0:3]):
+        question_stims += sm.get_stims(pm.input_dir, amodal_sequences[seq_name], question_modalities[m], lang=tools['exp_info']['lang'])
+    return question_stims
+
+def present_sequences(tools, amodal_sequences, trial_seq_org, trial_mod_org, seq_sounds, question_stims=None):
     ''' Present the 6 sequences of a trial before the questions. Returns nothing. 
-    Adapted so it can skip n sequences if the user wants to start from a specific sequence.'''
+    Adapted so it can skip n sequences if the user wants to start from a specific sequence.
+    The stimuli of the next sequence (or of the questions, for the last sequence) are decoded in the background 
+    and the next sequence's stimuli are built during the last fixation cross of the current one.'''
     logger = tools['logger']
+    prefetcher = tools['prefetcher']
     
     # check if we are starting from a specific point. If so, we skip the first sequences
     if tools['starting_point'] is not None:
@@ -1091,6 +1000,15 @@ def present_sequences(tools, amodal_sequences, trial_seq_org, trial_mod_org, seq
     else:
         n_skip = 0
 
+    all_stims = {} # get all the paths first, so the next sequence can be prefetched
+    for k in range(n_skip+1, pm.n_seq+1):
+        sequence = amodal_sequences[trial_seq_org[k-1]]
+        all_stims[k] = sm.get_stims(pm.input_dir, sequence, trial_mod_org[k-1], lang=tools['exp_info']['lang'])
+    if n_skip+1 in all_stims:
+        prefetcher.prefetch(all_stims[n_skip+1])
+    prepared = {} # stimuli built during the ISI, ready to be drawn
+    audio_plans = {} # jitters and pre-mixed track of the next sequence, built during the ISI too
+
     for k in range(n_skip+1, pm.n_seq+1): # using +1 to be consistant with the other loops, but not the nicest way to do it (k-1 under)
         modality = trial_mod_org[k-1]
         sequence_name = trial_seq_org[k-1]
@@ -1098,96 +1016,98 @@ def present_sequences(tools, amodal_sequences, trial_seq_org, trial_mod_org, seq
         snd_path = tools['sound_org'][sequence_name] # for the logger only
         snd = seq_sounds[sequence_name]
         #snd = None
-        stims = sm.get_stims(pm.input_dir, sequence, modality, lang=tools['exp_info']['lang'])
+        stims = all_stims[k]
+        next_stims = all_stims.get(k+1, question_stims or [])
+        prefetcher.prefetch(next_stims) # decoded by the worker while this sequence is presented
+
+        def prepare_next(k=k):
+            if k+1 in all_stims:
+                prepared[k+1] = prepare_stim_images(tools, all_stims[k+1])
+                audio_plans[k+1] = plan_sequence_audio(tools, seq_sounds[trial_seq_org[k]])
+
         logger.info(f'sequence number: {k}')
         logger.info(f'sequence name: {sequence_name}')
         logger.info(f'sequence modality: {modality}')
         logger.info(f'sound name: {snd_path}')
-        present_stimuli(tools, sequence, sequence_name, stims, modality, snd)
+        present_stimuli(tools, sequence, sequence_name, stims, modality, snd, stim_images=prepared.pop(k, None),
+            isi_task=prepare_next, audio_plan=audio_plans.pop(k, None))
     return
 
-def present_stimuli(tools, sequence, sequence_name, stims, modality, snd):
-    ''' Present the 6 stimuli of a sequence. Returns nothing. '''
-    debugging = tools['debugging']
+def prepare_stim_images(tools, stims):
+    ''' Load the decoded images of a sequence in the presentation pool. Has to be called from the render thread.'''
+    return tools['stim_pool'].load([tools['prefetcher'].get(stim) for stim in stims])
+
+def plan_sequence_audio(tools, snd):
+    ''' Draw the ISI jitters of a sequence and mix its sound at the onsets they give (in frames, as presented).
+    Returns the jitters and the SequenceTrack.'''
+    engine = tools['engine']
     jitters = np.linspace(-pm.jitter, pm.jitter, pm.n_seq)
     random.shuffle(jitters)
+    n_frames = [engine.n_frames(pm.stim_dur) + engine.n_frames(pm.isi_dur + jitter) for jitter in jitters]
+    onsets = np.concatenate([[0], np.cumsum(n_frames[:-1])]) * engine.frame_dur
+    return jitters, SequenceTrack(snd.signal, snd.sample_rate, onsets, tools['track_player'])
+
+def present_stimuli(tools, sequence, sequence_name, stims, modality, snd, stim_images=None, isi_task=None, audio_plan=None):
+    ''' Present the 6 stimuli of a sequence. Returns nothing. 
+    isi_task is called during the last fixation cross, to prepare what comes next.
+    The sound of the sequence is played once as a pre-mixed track (see plan_sequence_audio), started with the
+    onset of the first stimulus.'''
+    if audio_plan is None:
+        audio_plan = plan_sequence_audio(tools, snd)
+    jitters, track = audio_plan
+    if stim_images is None:
+        stim_images = prepare_stim_images(tools, stims)
+    t_track = None
     for i, stim in enumerate(stims):
-        if debugging:
-            continue
-        snd.play()
-        present_stimulus(tools, sequence, sequence_name, i, stim, modality, jitters[i], snd)
+        task = isi_task if i == len(stims) - 1 else None
+        if i == 0:
+            t_track = present_stimulus(tools, sequence, sequence_name, i, stim, modality, jitters[i], track, stim_images[i], isi_task=task)
+        else:
+            present_stimulus(tools, sequence, sequence_name, i, stim, modality, jitters[i], None, stim_images[i], isi_task=task,
+                audio_onset=t_track + track.onsets[i])
     return
 
-def present_stimulus(tools, sequence, sequence_name, i, stim, modality, jitter, snd): 
-    ''' Present a single stimulus. Returns nothing. '''
+def present_stimulus(tools, sequence, sequence_name, i, stim, modality, jitter, snd, stim_image, isi_task=None, audio_onset=None):
+    ''' Present a single stimulus. snd (if not None) is started with the onset flip. audio_onset is the planned onset
+    of the sound of this stimulus when it is part of a track that is already playing. Returns the audio onset.'''
     
-    debugging = tools['debugging']
     pport = tools['pport']
     logger = tools['logger']
     win = tools['win']
-    aspect_ratio = tools['aspect_ratio']
     background = tools['background']
 
     t_stim = pm.stim_dur 
     t_isi = pm.isi_dur + jitter
-    if debugging:
-        t_stim = 0.01
-        t_isi = 0.01
 
     stim_cat = sm.get_cat_from_stim(stim)
     trig1 = pm.triggers['mod_cat'][modality][stim_cat] # keys are 'img'/'txt' and category names (e.g., 'animals')
     trig2 = pm.triggers['seq_pos'][sequence_name][i] # key is seq name (e.g., 'A') and then index of the item to find trigger in the list
                         
     fl.check_escape_or_break(tools, pause_key=pm.key_dict['pause'])
-    stim_image = visual.ImageStim(
-        win=win,
-        image=stim,
-        size=(pm.img_size, pm.img_size*aspect_ratio)
-    )
 
-    # act a rectangle for photodiode
-    rect = visual.Rect(
-        win=win,
-        width=0.05,
-        height=0.05*aspect_ratio,
-        pos=(1, 1),
-        units='norm',
-        fillColor=(255, 255, 255),
-    )
-    
-    # Display fixation cross
-    fix_cross = visual.TextStim(win=win,
-        text='+',
-        font='Arial',
-        height=0.1,
-        color='black',
-        units='norm'
-    )
+    rect = tools['stim_pool'].rect # rectangle for photodiode
+    fix_cross = tools['stim_pool'].fix_cross
 
-    background.draw()
-    rect.draw()
-    stim_image.draw()
+    engine = tools['engine']
+    n_stim = engine.n_frames(t_stim)
+    n_isi = engine.n_frames(t_isi)
     # log info there to be closer to the actual presentation
     logger.info(f'stimulus number: {i+1}')
     logger.info(f'stimulus name: {str(sequence[i])}')
     logger.info(f'stimulus category: {stim_cat}')
     logger.info(f'stimulus path: {stim}')
 
+    if snd is not None:
+        audio_onset = engine.schedule_sound(snd, hold=[background]) # the sound starts with the onset flip of the stimulus
     win.callOnFlip(fl.novov_trigger,pport=pport, trig1=trig1, trig2=trig2, delay=10)
-    #win.callOnFlip(snd.play) # play sound at the beginning of the stimulus presentation
-    win.flip()
-    t1 = time.time()
-    core.wait(t_stim)
-    #fl.wait_frate(win, [background, rect, stim_image], frate=pm.frate, t=t_stim) # wait for the frame rate to be reached
-    print(f"stimulus {i+1} presented in {time.time()-t1:.5f} seconds")
-    background.draw()
-    fix_cross.draw()
-    win.flip()
-    t3 = time.time()
-    core.wait(t_isi)
-    #fl.wait_frate(win, [background, fix_cross], frate=pm.frate, t=t_isi)
-    print(f"stimulus {i+1} ISI in {time.time()-t3:.5f} seconds")
-    return
+    dropped_stim = engine.present([background, rect, stim_image], n_stim)
+    if audio_onset is not None:
+        engine.av_prediction_errors.append(audio_onset - engine.onset)
+        logger.info(f'scheduled audio onset: {audio_onset:.4f}, visual onset: {engine.onset:.4f}, prediction error: {1000*(audio_onset - engine.onset):.2f} ms')
+    # the next stimuli are prepared while the fixation cross is on screen
+    dropped_isi = engine.present([background, fix_cross], n_isi, task=isi_task)
+    logger.info(f'stimulus frames: {n_stim} + {n_isi} (isi), dropped: {dropped_stim} + {dropped_isi} (isi)')
+    return audio_onset
 
 def present_rewarded_sequences(tools:dict):
     ''' Tells the participant which sequences are rewarded for the last question.'''
@@ -1201,13 +1121,12 @@ def present_rewarded_sequences(tools:dict):
     run_seq = reward_seq + no_reward_seq
     random.shuffle(run_seq) # shuffle the order of the sequences so the reawrded ones are not always first
     modality = 'img'
-    amodal_sequences = sm.generate_sequences(pm.input_dir, pm.seq_structures, lang=tools['exp_info']['lang'], seed=tools['seed'])
-
-    first_stim_paths = {} # get the paths of the first images to be presented as indicators of each sequence
+    # the first image of each sequence comes from the design of the session, decoded with the prefetcher
+    catalog = tools['asset_store'].catalogs[tools['exp_info']['lang']]
+    first_stims = {}
     for seq_name in run_seq:
-        sequence = amodal_sequences[seq_name]
-        first_stim = sm.get_stims(pm.input_dir, sequence, modality, lang=tools['exp_info']['lang'])[0] # only the first image
-        first_stim_paths[seq_name] = first_stim
+        first_item = tools['amodal_sequences'][seq_name][0]
+        first_stims[seq_name] = tools['prefetcher'].get(catalog[first_item][modality])
 
     # construct the grid to store the 6 images
     xs = [-0.5, 0, 0.5]*2
@@ -1216,62 +1135,45 @@ def present_rewarded_sequences(tools:dict):
 
     # define the objects to be presented
     text = it.get_txt(tools['exp_info']['lang'], 'instr_reward_fn')
-    instructions = visual.TextStim(
-        win=win,
-        text=text,
-        pos=(0, 0.85),
-        height=pm.text_height,
-        color='black',
-        units='norm'
-    )
-    stim_dict = {}
+    instructions = tools['texts'].get(text, **text_styles['reward'])
+    images = []
+    highlights = [] # only the rewarded sequences have a (flickering) highlight
     for i, seq_name in enumerate(run_seq):
-        hl_color = pm.rw_hl_color if seq_name in reward_seq else None # invisible highlight if no reward
-        stim_dict[seq_name] = {}
-        stim_dict[seq_name]['image'] = visual.ImageStim(
+        images.append(visual.ImageStim(
             win=win,
-            image=first_stim_paths[seq_name],
+            image=first_stims[seq_name],
             pos=(xs[i], ys[i]),
             size=(pm.rw_img_size, pm.rw_img_size * tools['aspect_ratio']),
-        )
-        stim_dict[seq_name]['highlight'] = visual.Rect(
-            win=win,
-            width=pm.rw_hl_size,
-            height=pm.rw_hl_size * tools['aspect_ratio'],
-            pos=(xs[i], ys[i]),
-            fillColor=hl_color,
-        )
+        ))
+        if seq_name in reward_seq:
+            highlights.append(visual.Rect(
+                win=win,
+                width=pm.rw_hl_size,
+                height=pm.rw_hl_size * tools['aspect_ratio'],
+                pos=(xs[i], ys[i]),
+                fillColor=pm.rw_hl_color,
+            ))
+    static_layer = build_static_layer(win, [background, instructions])
 
     logger.info('Presenting rewarded sequences')
     logger.info(f'rewarded sequences: {reward_seq}')
 
     # display images for 1 s before the highligh
-    background.draw()
-    instructions.draw()
-    for seq_name in stim_dict:
-        stim_dict[seq_name]['image'].draw()
-    win.flip()
-    core.wait(1)
-
-    # start the flickering loop 
-    start_time = time.time()
-    t_stop = start_time + pm.t_reward_info
-    i_count = 0
-
-    while time.time() < t_stop:
-        elapsed_time = time.time() - start_time
-        flick_val = 0.5 * (1 + math.sin(2 * math.pi * pm.flick_freq * elapsed_time)) # smooth flicker 
-        background.draw()
-        instructions.draw()
-        for seq_name in stim_dict:
-            highlight = stim_dict[seq_name]['highlight']
+    engine = tools['engine']
+    engine.present([static_layer] + images, engine.n_frames(1))
+
+    # start the flickering loop, one precomputed opacity value per refresh. The time scale shortens the flicker
+    # (frames), the frequency is kept: scaled, it would go past the Nyquist limit of the screen and alias
+    opacities = flicker_table(engine.frames['t_reward_info'], pm.flick_freq, engine.frate)
+    win.callOnFlip(pport.signal, pm.triggers['misc']['reward_info']) # send trigger at the beginning of the reward pres
+    for flick_val in opacities:
+        static_layer.draw()
+        for highlight in highlights:
             highlight.opacity = flick_val
             highlight.draw()
-            stim_dict[seq_name]['image'].draw()
-        if i_count == 0:
-            win.callOnFlip(pport.signal, pm.triggers['misc']['reward_info']) # send trigger at the beginning of the reward pres
+        for image in images:
+            image.draw()
         win.flip()
-        i_count += 1
 
     logger.info('Rewarded sequences presented successfully')
     return 
@@ -1280,8 +1182,8 @@ def present_rewarded_sequences(tools:dict):
 #########################
 # highest level functions
 
-def pipeline(debugging=False):
-    tools = execute_run(debugging=debugging)
+def pipeline(debugging=False, participant=None):
+    tools = execute_run(debugging=debugging, participant=participant)
     post_run_break(tools, pause_i=1)
     present_rewarded_sequences(tools)
     post_run_break(tools, pause_i=2)
@@ -1,7 +1,4 @@
 from psychopy import visual, event, core
-import glob
-import os
-import re
 import sequences.params as pm
 import sequences.flow as fl
 import sequences.stimuli_manager as sm
@@ -10,11 +7,8 @@ from sequences.common import get_win_dict
 
 # This scripts shows the images and the related words to the participant
 def present_stims(lang="fr"):
-    # get all the stimuli
-    all_items = glob.glob(f"data/input/stims/{lang}/*/*.png")
-    all_items = sorted(set([os.path.basename(item).split('_')[0] for item in all_items]))   
-    all_img = sorted(glob.glob(f"data/input/stims/{lang}/*/*img.png"))
-    all_txt = sorted(glob.glob(f"data/input/stims/{lang}/*/*txt.png"))
+    # get all the stimuli, indexed by item: {'bear': {'cat': 'animals', 'img': path, 'txt': path}, ...}
+    catalog = sm.get_stim_catalog(pm.input_dir, lang)
 
     # Create a window
     win_dict = get_win_dict()
@@ -22,60 +16,56 @@ def present_stims(lang="fr"):
     background = win_dict['background']
     aspect_ratio = win_dict['aspect_ratio']
     win.mouseVisible = False
+    tools = {'logger': None, 'win': win, 'adapt_waitKeys': event.waitKeys, 'event_fun': event.getKeys} # for the escape check
 
-    instr1 = it.get_txt(lang, 'instr_stimpres_fn')
-    fl.type_text(
-        instr1,
-        win,
-        height=pm.text_height,
-        background=background,
-        t=pm.t,
-    ) 
-
-    event.waitKeys(keyList=['space'])
-
-    for item in all_items: # match the image and the text
-        
-        # use regex with word boundaries to match exact words. # The \b ensures a word boundary (had an issue with 'ear' and 'bear')
-        item_img_list = [img for img in all_img if re.search(rf'\b{item}_img\.png\b', img)] 
-        item_txt_list = [txt for txt in all_txt if re.search(rf'\b{item}_txt\.png\b', txt)]
-
-        if item_img_list and item_txt_list:
-            item_img = item_img_list[0]
-            item_txt = item_txt_list[0]
-        else:
+    # preload every pair so key presses advance with no loading gap
+    pairs = []
+    for item, stims in sorted(catalog.items()):
+        if 'img' not in stims or 'txt' not in stims:
             print(f'Warning: No match found for {item}')
-
-        win.flip()
-        core.wait(0.02) # to add a white flash between stims
-        fl.check_escape(win)
-
+            continue
         img_stim = visual.ImageStim(
-            win, 
-            image=item_img,
+            win,
+            image=stims['img'],
             size=(pm.img_size, pm.img_size*aspect_ratio),
             pos=(0, 0.45),
             units="norm"
         )
-
         txt_stim = visual.ImageStim(
-            win, 
-            image=item_txt,
+            win,
+            image=stims['txt'],
             size=(pm.img_size, pm.img_size*aspect_ratio),
             pos=(0, -0.25),
             units="norm"
         )
+        pairs.append((img_stim, txt_stim))
 
-        instr2 = it.get_txt(lang, 'instr_stimpres2_fn')
-        txt_instr = visual.TextStim(
-            win,
-            text=instr2,
-            font="Arial",
-            color='black',
-            height=pm.text_height,
-            pos = (0, -0.85),
-            alignText="center"
-        )
+    instr2 = it.get_txt(lang, 'instr_stimpres2_fn')
+    txt_instr = visual.TextStim(
+        win,
+        text=instr2,
+        font="Arial",
+        color='black',
+        height=pm.text_height,
+        pos = (0, -0.85),
+        alignText="center"
+    )
+
+    instr1 = it.get_txt(lang, 'instr_stimpres_fn')
+    fl.type_text(
+        instr1,
+        win,
+        height=pm.text_height,
+        background=background,
+        t=pm.t,
+    )
+
+    event.waitKeys(keyList=['space'])
+
+    for img_stim, txt_stim in pairs:
+        win.flip()
+        core.wait(0.02) # to add a white flash between stims
+        fl.check_escape_or_break(tools, pause_key=pm.key_dict['pause'])
 
         #background.draw()
         img_stim.draw()
@@ -100,5 +90,5 @@ def present_stims(lang="fr"):
 
 if __name__ == "__main__":
     lang = input("Langue (fr/en): ")
-    sm.check_img_txt(pm.input_dir, lang) 
-    present_stims(lang)
\ No newline at end of file
+    sm.check_img_txt(pm.input_dir, lang)
+    present_stims(lang)
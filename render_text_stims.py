@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import List
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from matplotlib import font_manager
+from PIL import Image, ImageDraw, ImageFont
+from sequences.assets import hash_file
+
+# This script renders the *_txt.png word stimuli from the word table (one column per language), in a process pool.
+# Only the entries whose inputs (word, font, layout) changed since the last run are rendered again.
+# stim_words.csv is the only word list: edit it (not a copy) to change a word or add a language.
+
+word_dir = Path('data/input/word_lists')
+stim_words_fn = word_dir / 'stim_words.csv' # category, item, en, fr, ...
+stims_root = Path('data/input/stims') # <lang>/<category>/<item>_img.png
+out_root = Path('data/output/text_stims') # copy the results to data/input/stims/<lang> once checked
+manifest_fn = out_root / 'manifest.json'
+
+# same size and background as the hand-made stimuli
+img_size = 777
+border = 10
+font_size = 110
+bg_color = (255, 255, 255, 255)
+fg_color = (30, 30, 30, 255)
+default_font = 'Arial' # font family or path of a font file
+fonts = {} # category -> font family or file, e.g. {'characters': 'fonts/script.ttf'}
+
+def resolve_font(font:str)-> str:
+    ''' Path of a font file. A path is used as is, a family name is looked up in the fonts installed on the system.'''
+    if os.path.isfile(font):
+        return font
+    try:
+        return font_manager.findfont(font_manager.FontProperties(family=font), fallback_to_default=False)
+    except ValueError:
+        raise FileNotFoundError(f"Font '{font}' not found. Install it (Arial is in ttf-mscorefonts-installer on Ubuntu) "
+            "or set the path of a font file in default_font / fonts.") from None
+
+def read_word_list(fn=stim_words_fn)-> pd.DataFrame:
+    ''' Read the word list'''
+    return pd.read_csv(fn)
+
+def check_items(table:pd.DataFrame, langs:List[str], root=stims_root):
+    ''' Check that the word list has a word for each image stimulus of each language, and no entry without an image'''
+    for lang in langs:
+        images = {(fn.parent.name, fn.name[:-len('_img.png')]) for fn in Path(root, lang).glob('*/*_img.png')}
+        words = {(row['category'], row['item']) for row in table.to_dict('records') if not pd.isna(row[lang])}
+        missing, extra = sorted(images - words), sorted(words - images)
+        if missing or extra:
+            raise ValueError(f"The word list does not match {Path(root, lang)}: "
+                f"no {lang} word for {missing}, no image for {extra}")
+
+def get_jobs(table:pd.DataFrame, langs:List[str]=None)-> List[dict]:
+    ''' One job per category/word/language. Each job holds everything needed to render the image.'''
+    if langs is None:
+        langs = [col for col in table.columns if col not in ('category', 'item')]
+    font_files = {font: resolve_font(font) for font in {default_font, *fonts.values()}} # fails early if a font is missing
+    font_hashes = {fn: hash_file(fn) for fn in font_files.values()}
+    jobs = []
+    for row in table.to_dict('records'):
+        for lang in langs:
+            if pd.isna(row[lang]):
+                continue
+            font = font_files[fonts.get(row['category'], default_font)]
+            jobs.append({
+                'word': str(row[lang]),
+                'font': font,
+                'font_hash': font_hashes[font],
+                'font_size': font_size,
+                'img_size': img_size,
+                'border': border,
+                'out': str(out_root / lang / row['category'] / f"{row['item']}_txt.png"),
+            })
+    return jobs
+
+def job_key(job:dict)-> str:
+    ''' Digest of the inputs of a job, used to skip the entries that did not change'''
+    return hashlib.sha1(json.dumps(job, sort_keys=True).encode('utf-8')).hexdigest()
+
+def render_word(job:dict)-> str:
+    ''' Render a single word on a white square with a black frame. Runs in a worker process.'''
+    size = job['img_size']
+    img = Image.new('RGBA', (size, size), bg_color)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, size - 1, size - 1], outline=(0, 0, 0, 255), width=job['border'])
+    font = ImageFont.truetype(job['font'], job['font_size'])
+    draw.text((size / 2, size / 2), job['word'], font=font, fill=fg_color, anchor='mm')
+    os.makedirs(os.path.dirname(job['out']), exist_ok=True)
+    img.save(job['out'])
+    return job['out']
+
+def render_all(langs:List[str]=None, n_workers:int=None)-> List[str]:
+    ''' Render all the text stimuli that are missing or outdated. Returns the paths of the rendered files.'''
+    table = read_word_list()
+    if langs is None:
+        langs = [col for col in table.columns if col not in ('category', 'item')]
+    check_items(table, langs)
+    jobs = get_jobs(table, langs)
+    manifest = {}
+    if manifest_fn.exists():
+        with open(manifest_fn, 'r') as f:
+            manifest = json.load(f)
+    todo = [job for job in jobs if manifest.get(job['out']) != job_key(job) or not os.path.exists(job['out'])]
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        rendered = list(executor.map(render_word, todo))
+
+    for job in todo:
+        manifest[job['out']] = job_key(job)
+    os.makedirs(out_root, exist_ok=True)
+    with open(manifest_fn, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    print(f'{len(rendered)} text stimuli rendered, {len(jobs) - len(rendered)} up to date')
+    return rendered
+
+if __name__ == '__main__':
+    langs = input('Languages (e.g. fr,en - empty for all): ').strip()
+    render_all(langs=langs.split(',') if langs else None)
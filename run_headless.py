@@ -0,0 +1,35 @@
+import time
+import argparse
+from sequences import headless
+from sequences.agent import SimulatedParticipant
+
+# This script runs full sessions (both runs, bonus questions and TMR) with the headless backend: no screen, GPU,
+# audio device or dialog is needed and all the waits are virtual. Used to check throughput and regressions.
+
+def run_session(subject_id:str='99', runs=('01', '02'), lang:str='fr', seed:int=0, participant=None, debugging:bool=False)-> dict:
+    ''' Run the whole pipeline once per run and return the counters of the backend with the wall-clock duration.
+    The responses come from participant (a SimulatedParticipant), random keys if None. debugging runs the
+    pipeline in debugging mode (debug time scale).'''
+    headless.install(seed=seed)
+    import pipeline # imported after install so it gets the headless interfaces
+
+    start = time.perf_counter()
+    for run in runs:
+        headless.session_info.update({'ID': subject_id, 'run': run, 'lang': lang})
+        try:
+            pipeline.pipeline(debugging=debugging, participant=participant)
+        except headless.SessionEnd as end:
+            if end.error is not None:
+                raise RuntimeError(f'run {run} ended with an error') from end.error
+    return {**headless.stats(), 'wall_time': time.perf_counter() - start}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run full sessions without a display')
+    parser.add_argument('--id', default='99', help='participant ID (numeric, used as seed)')
+    parser.add_argument('--lang', default='fr')
+    parser.add_argument('--accuracy', type=float, default=0.7, help='accuracy of the simulated participant')
+    parser.add_argument('--random-keys', action='store_true', help='press random keys instead of simulating a participant')
+    parser.add_argument('--debugging', action='store_true', help='run in debugging mode (params.debug_time_scale)')
+    args = parser.parse_args()
+    agent = None if args.random_keys else SimulatedParticipant(accuracy=args.accuracy, seed=int(args.id))
+    print(run_session(subject_id=args.id, lang=args.lang, participant=agent, debugging=args.debugging))
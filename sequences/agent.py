@@ -0,0 +1,126 @@
+import copy
+import math
+import random
+from collections import deque
+from typing import Dict, List
+from psychopy import core
+import sequences.params as pm
+
+# simulated participant: produces the key presses of the task on the clock of the experiment (the virtual clock of
+# the headless backend, see sequences/headless.py), so full sessions can run without anybody at the keyboard
+
+class SimulatedParticipant:
+    ''' Answers the in-task questions, the Likert scales and the bonus placements. It is plugged in through the
+    tools dict (event_fun, clear_event_fun, wait_fun and adapt_waitKeys) and the task tells it what the next response
+    is about with fl.expect(). Each response is planned as key presses timed on core.getTime().
+    - accuracy: probability of choosing the correct slot in a question, bonus_accuracy for each bonus placement
+    - decision times are lognormal (median rt_median, log-sd rt_sigma), key_interval separates two presses
+    - likert: relative weights of the values of the scales (uniform by default)
+    - time_scale: the times are divided by it, like the durations of the session (see params.time_scale)'''
+
+    def __init__(self, accuracy:float=0.7, bonus_accuracy:float=0.5, rt_median:float=0.9, rt_sigma:float=0.35,
+            key_interval:float=0.15, likert:List[float]=None, seed:int=0):
+        self.accuracy = accuracy
+        self.bonus_accuracy = bonus_accuracy
+        self.rt_median = rt_median
+        self.rt_sigma = rt_sigma
+        self.key_interval = key_interval
+        self.likert = likert if likert is not None else [1] * pm.n_ticks
+        self.time_scale = 1
+        self.rng = random.Random(seed)
+        self.plan = deque() # (time, key) of the planned presses, in order
+
+    def tools(self)-> Dict:
+        ''' Entries of the tools dict that route the input and the waits through the participant'''
+        return {
+            'participant': self,
+            'event_fun': self.get_keys,
+            'clear_event_fun': self.clear,
+            'wait_fun': self.wait,
+            'adapt_waitKeys': self.wait_keys,
+        }
+
+    def rt(self)-> float:
+        return self.rng.lognormvariate(math.log(self.rt_median), self.rt_sigma) / self.time_scale
+
+    def wait(self, secs:float, hogCPUperiod:float=0.2):
+        core.wait(secs, hogCPUperiod=hogCPUperiod)
+
+    def get_keys(self, keyList=None, **kwargs)-> List[str]:
+        ''' Keys whose press time has come'''
+        now = core.getTime()
+        keys = []
+        while self.plan and self.plan[0][0] <= now:
+            keys.append(self.plan.popleft()[1])
+        return keys
+
+    def clear(self, eventType=None):
+        ''' Drop the presses that are due (like clearing the event buffer), the planned ones are kept'''
+        self.get_keys()
+
+    def wait_keys(self, keyList=None, **kwargs)-> List[str]:
+        ''' Read the screen for a decision time, then press the first allowed key (confirm if any key is allowed)'''
+        self.wait(self.rt())
+        if keyList is None:
+            return [pm.key_dict['confirm']]
+        if isinstance(keyList, str):
+            keyList = [keyList]
+        return [keyList[0]]
+
+    def expect(self, kind:str, **info):
+        ''' Plan the response to the next screen: 'question', 'likert' or 'bonus' (see the _plan_ methods)'''
+        getattr(self, f'_plan_{kind}')(**info)
+
+    def _schedule(self, presses:List[List[str]]):
+        ''' Each group of keys is pressed after a decision time, one key_interval between the keys of a group'''
+        t = core.getTime()
+        interval = self.key_interval / self.time_scale
+        self.plan.clear()
+        for keys in presses:
+            t += self.rt()
+            for i, key in enumerate(keys):
+                self.plan.append((t + i * interval, key))
+            t += interval * (len(keys) - 1)
+
+    def _plan_question(self, answer:int, n_slots:int):
+        ''' answer is the index of the correct slot, the highlight starts on the first slot'''
+        target = answer
+        if self.rng.random() >= self.accuracy:
+            target = self.rng.choice([i for i in range(n_slots) if i != answer])
+        self._schedule([[pm.key_dict['right']] * target + [pm.key_dict['confirm']]])
+
+    def _plan_likert(self, n_ticks:int, start:int):
+        value = self.rng.choices(range(n_ticks), weights=self.likert)[0]
+        move = pm.key_dict['right'] if value > start else pm.key_dict['left']
+        self._schedule([[move] * abs(value - start) + [pm.key_dict['confirm']]])
+
+    def _plan_bonus(self, state, targets:List[int], cursor:int=0):
+        ''' targets are the grid positions of the items in the correct order. The placements are simulated on a
+        copy of the bonus state, so the cursor moves account for the images already placed.'''
+        sim = copy.deepcopy(state)
+        presses = []
+        for target in targets:
+            paths = self._bonus_paths(sim, cursor)
+            free = [pos for pos in paths if not sim.is_placed(pos)]
+            if not free:
+                break
+            if target not in free or self.rng.random() >= self.bonus_accuracy:
+                target = self.rng.choice(free)
+            presses.append([pm.key_bq[d] for d in paths[target]] + [pm.key_bq['confirm']])
+            sim.place(target)
+            cursor = target
+        self._schedule(presses)
+
+    @staticmethod
+    def _bonus_paths(state, start:int)-> Dict[int, List[str]]:
+        ''' Shortest cursor moves from start to every reachable grid position (breadth first)'''
+        paths = {start: []}
+        queue = deque([start])
+        while queue:
+            pos = queue.popleft()
+            for direction in state.neighbors:
+                nxt = state.move_cursor(pos, direction)
+                if nxt not in paths:
+                    paths[nxt] = paths[pos] + [direction]
+                    queue.append(nxt)
+        return paths
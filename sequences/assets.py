@@ -0,0 +1,56 @@
+import hashlib
+import os
+from typing import Dict
+from sequences import stimuli_manager as sm
+
+# content-addressed index of the stimulus files, so identical files are read and decoded only once
+
+def hash_file(path:str, chunk_size:int=1 << 16)-> str:
+    ''' Return the sha1 digest of the content of a file'''
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class AssetStore:
+    ''' Maps every stimulus path to the digest of its content. Paths with the same content
+    (e.g. an image shared by the en and fr folders) resolve to the same entry.'''
+
+    def __init__(self):
+        self._digests = {} # path -> digest
+        self.sources = {} # digest -> path of the file that is actually read
+        self.catalogs = {} # lang -> catalog, filled by index_catalogs
+
+    def key(self, path:str)-> str:
+        ''' Return the digest of a file. Each path is hashed only once.'''
+        path = str(path)
+        if path not in self._digests:
+            digest = hash_file(path)
+            self._digests[path] = digest
+            self.sources.setdefault(digest, path)
+        return self._digests[path]
+
+    def source(self, path:str)-> str:
+        ''' Return the path of the shared file with the same content'''
+        return self.sources[self.key(path)]
+
+    def index_catalogs(self, input_dir:str, langs:list=None)-> Dict[str, Dict[str, Dict[str, str]]]:
+        ''' Hash the stimuli of all languages (all the folders in stims/ except demo).
+        Returns the catalogs of sm.get_stim_catalog() with the img/txt paths resolved to their shared source.'''
+        if langs is None:
+            stim_dir = os.path.join(input_dir, 'stims')
+            langs = sorted(d for d in os.listdir(stim_dir) if d != 'demo' and not d.startswith('.'))
+        catalogs = {}
+        for lang in langs:
+            catalogs[lang] = sm.get_stim_catalog(input_dir, lang)
+            for stims in catalogs[lang].values():
+                for modality in ('img', 'txt'):
+                    if modality in stims:
+                        stims[modality] = self.source(stims[modality])
+        self.catalogs.update(catalogs)
+        return catalogs
+
+    def stats(self)-> Dict[str, int]:
+        ''' Number of indexed files and number of unique contents'''
+        return {'files': len(self._digests), 'unique': len(self.sources)}
@@ -1,10 +1,13 @@
 import os
+import random
 from pathlib import Path
+from typing import Dict, List, Tuple
 import pandas as pd
 import numpy as np
 from psychopy import visual #, event
 from sequences import stimuli_manager as sm
 from sequences import params as pm
+from sequences.presentation import build_atlas, atlas_size, atlas_coords, tile_size
 
 # functions for the reward computation and feedback
 
@@ -28,142 +31,234 @@ def read_seq_file(s_id, r_id, seq_name):
 
 # functions for the interactive slot filling task
 
-def check_slot_filling(start_item_img, images, slots, occ_count, win, background, out_path, txt, key_map, adapt_waitKeys):
+def slot_texture(res:int=32, border:int=1)-> np.ndarray:
+    ''' Luminance texture of an empty slot: grey square with a black border, like the slot rects'''
+    tex = np.full((res, res), 105 / 127.5 - 1)
+    tex[:border, :] = tex[-border:, :] = tex[:, :border] = tex[:, -border:] = -1
+    return tex
+
+class BonusGrid:
+    ''' Images of the bonus question drawn in a single call: they are packed in one texture and drawn as an
+    ElementArrayStim where each element shows its own tile. Moving or hiding an image only updates the arrays.
+    The empty slots are a second element array and the cursor a single highlight rectangle.
+    Built once per bonus phase with all the images of the run, and reset before each sequence.'''
+
+    def __init__(self, win, aspect_ratio:float, img_paths:List[str], slot_positions:List[Tuple[float, float]], tile_px:int=128):
+        self.paths = list(img_paths)
+        n = len(self.paths)
+        n_tiles = atlas_size(n)
+        tile = tile_size(self.paths[0], tile_px)
+        phases, fraction = atlas_coords(n, n_tiles, tile)
+        size = np.array([pm.bq_img_size, pm.bq_img_size * aspect_ratio])
+        self.xys = np.zeros((n, 2))
+        self.opacities = np.ones(n)
+        self.images = visual.ElementArrayStim(
+            win,
+            units='norm',
+            nElements=n,
+            sizes=size,
+            xys=self.xys,
+            opacities=self.opacities,
+            sfs=fraction / size,
+            phases=phases,
+            elementTex=build_atlas(self.paths, n_tiles, tile),
+            elementMask=None,
+        )
+        self.slot_pos = np.array(slot_positions, dtype=float)
+        self.slot_opacities = np.ones(len(self.slot_pos))
+        self.slots = visual.ElementArrayStim(
+            win,
+            units='norm',
+            nElements=len(self.slot_pos),
+            sizes=size,
+            xys=self.slot_pos,
+            opacities=self.slot_opacities,
+            elementTex=slot_texture(),
+            elementMask=None,
+            interpolate=False,
+        )
+        self.cursor = visual.Rect(
+            win,
+            width=pm.bq_hl_size,
+            height=pm.bq_hl_size * aspect_ratio,
+            lineColor="blue",
+            lineWidth=5,
+            opacity=0,
+        )
+        self.cursor_idx = None
+        self.start_idx = None
+        self.home = self.xys.copy() # position of each image in the grid
+
+    def reset(self, positions, start_idx:int, start_pos)-> np.ndarray:
+        ''' Shuffle the images over the grid positions for the next sequence and empty the slots.
+        The start item is moved next to the slots: its grid position stays blank.
+        Returns the image shown at each grid position.'''
+        order = list(range(len(self.paths)))
+        random.shuffle(order) # random is seeded with the participant ID
+        order = np.array(order)
+        self.xys[order] = np.asarray(positions)[:len(order)]
+        self.xys[start_idx] = start_pos
+        self.images.xys = self.xys
+        self.home = self.xys.copy()
+        self.start_idx = start_idx
+        self.slot_opacities[:] = 1
+        self.slots.opacities = self.slot_opacities
+        self.set_cursor(None)
+        return order
+
+    def move(self, i:int, pos):
+        ''' Move image i to pos'''
+        self.xys[i] = pos
+        self.images.xys = self.xys
+
+    def fill_slot(self, i:int, occupied:bool):
+        ''' Hide (occupied) or show (empty) the rect of slot i'''
+        self.slot_opacities[i] = 0 if occupied else 1
+        self.slots.opacities = self.slot_opacities
+
+    def set_cursor(self, i:int=None):
+        ''' Put the highlight on image i, or hide it if i is None'''
+        if i == self.cursor_idx:
+            return
+        self.cursor_idx = i
+        if i is None:
+            self.cursor.opacity = 0
+        else:
+            self.cursor.pos = self.xys[i]
+            self.cursor.opacity = 1
+
+    def draw(self):
+        self.slots.draw()
+        self.images.draw()
+        self.cursor.draw()
+
+    def draw_placed(self, placed:np.ndarray):
+        ''' Draw only the images in the slots (placed is a boolean mask over the images)'''
+        self.images.opacities = self.opacities * placed
+        self.images.draw()
+        self.images.opacities = self.opacities
+
+def neighbor_tables(rows:int, cols:int, n:int)-> Dict[str, List[int]]:
+    ''' For each direction, the grid position next to each position (-1 on the edges).
+    Positions are numbered column by column, as in gen_img_positions.'''
+    idx = np.arange(n)
+    col, row = idx // rows, idx % rows
+    def step(d_col, d_row):
+        c, r = col + d_col, row + d_row
+        nxt = c * rows + r
+        valid = (c >= 0) & (c < cols) & (r >= 0) & (r < rows) & (nxt < n)
+        return np.where(valid, nxt, -1).tolist()
+    return {'up': step(0, -1), 'down': step(0, 1), 'left': step(-1, 0), 'right': step(1, 0)}
+
+class BonusState:
+    ''' State of the slot filling task, indexed by grid position and by slot:
+    slot_of[pos] is the slot holding the image of grid position pos (-1 if none), image_in[slot] the grid position
+    of the image in the slot (-1 if empty). Slots are filled from left to right and emptied in reverse order
+    through the undo stack, so the next free slot is always n_filled.'''
+
+    def __init__(self, n_pos:int, n_slots:int, rows:int=6, cols:int=6, blocked:List[int]=()):
+        self.n_slots = n_slots
+        self.slot_of = np.full(n_pos, -1)
+        self.image_in = np.full(n_slots, -1)
+        self.blocked = np.zeros(n_pos, dtype=bool) # positions that are never interactive (blank left by the start item)
+        self.blocked[list(blocked)] = True
+        self.n_filled = 0
+        self.stack = []
+        self.neighbors = neighbor_tables(rows, cols, n_pos)
+
+    def is_placed(self, pos:int)-> bool:
+        return self.blocked[pos] or self.slot_of[pos] >= 0
+
+    def is_full(self)-> bool:
+        return self.n_filled == self.n_slots
+
+    def move_cursor(self, pos:int, direction:str)-> int:
+        ''' Next position in the direction that still holds an image, or pos if there is none'''
+        nxt = self.neighbors[direction][pos]
+        while nxt != -1 and self.is_placed(nxt):
+            nxt = self.neighbors[direction][nxt]
+        return pos if nxt == -1 else nxt
+
+    def place(self, pos:int)-> int:
+        ''' Put the image of grid position pos in the next free slot. Returns the slot, or -1 if nothing moved.'''
+        if self.is_placed(pos) or self.is_full():
+            return -1
+        slot = self.n_filled
+        self.slot_of[pos] = slot
+        self.image_in[slot] = pos
+        self.n_filled += 1
+        self.stack.append(pos)
+        return slot
+
+    def undo(self)-> Tuple[int, int]:
+        ''' Remove the last placed image. Returns its grid position and slot, or None if all slots are empty.'''
+        if not self.stack:
+            return None
+        pos = self.stack.pop()
+        slot = self.slot_of[pos]
+        self.slot_of[pos] = -1
+        self.image_in[slot] = -1
+        self.n_filled -= 1
+        return pos, slot
+
+def handle_select_or_place(grid, state, order, pos):
+    slot = state.place(pos)
+    if slot >= 0:
+        grid.move(order[pos], grid.slot_pos[slot])
+        grid.fill_slot(slot, True)
+
+def handle_undo(grid, state, order):
+    undone = state.undo()
+    if undone is not None:
+        pos, slot = undone
+        grid.move(order[pos], grid.home[order[pos]])
+        grid.fill_slot(slot, False)
+    return undone
+
+def reset_image_positions(grid, state, order):
+    while handle_undo(grid, state, order) is not None:
+        pass
+
+def check_slot_filling(grid, state, order, win, background, out_path, validate, key_map, adapt_waitKeys):
     conf = key_map['confirm']
     rem = key_map['remove']
-    if occ_count == 5:
-        resp = confirm_slot_filling(start_item_img, images, win, background, txt, adapt_waitKeys, resp_keys=[conf, rem])
+    if state.is_full():
+        resp = confirm_slot_filling(grid, state, order, win, background, validate, adapt_waitKeys, resp_keys=[conf, rem])
         if resp[0] == conf: 
-            running = save_slot_data(start_item_img, slots, out_path)
+            running = save_slot_data(grid, state, order, out_path)
         elif resp[0] == rem:
-            reset_image_positions(images, slots)
+            reset_image_positions(grid, state, order)
             running = True
     else:
         running = True
     return running
 
-def confirm_slot_filling(start_item_img, images, win, background, txt, adapt_waitKeys, resp_keys):
-    validate = visual.TextStim(
-        win,
-        text=txt,
-        pos=(0, 0),
-        color="black",
-    )
+def confirm_slot_filling(grid, state, order, win, background, validate, adapt_waitKeys, resp_keys):
+    placed = np.zeros(len(grid.paths), dtype=bool)
+    placed[order[state.image_in]] = True
+    placed[grid.start_idx] = True
     background.draw()
-    for img in images:
-        if img["placed"]:
-            img["stim"].draw()
-    start_item_img.draw()
+    grid.draw_placed(placed)
     validate.draw()
     win.flip()
     resp = adapt_waitKeys(keyList=resp_keys)
     return resp
 
-def reset_image_positions(images, slots):
-    for img in images:
-        img["stim"].pos = img["orig_pos"]
-        img["placed"] = False
-    for slot in slots:
-        slot["occupied"] = False
-        slot["image"] = None
-        slot["rect"].opacity = 1
-
-def save_slot_data(start_item_img, slots, out_path):
+def save_slot_data(grid, state, order, out_path):
     running = False
-    first_img_path = start_item_img.image
+    first_img_path = grid.paths[grid.start_idx]
     first_img_cat = sm.get_cat_from_stim(first_img_path)
     first_img = os.path.basename(first_img_path.split(".")[0].split("_")[0])
     with open(out_path, "w") as f:
         f.write("slot,answer,answer_cat\n")
         f.write(f"0,{first_img},{first_img_cat}\n")
-        for i, slot in enumerate(slots):
-            stim_path = slot["image"]["stim"].image
+        for i, pos in enumerate(state.image_in):
+            stim_path = grid.paths[order[pos]]
             stim_name = os.path.basename(stim_path.split(".")[0].split("_")[0])
             stim_cat = sm.get_cat_from_stim(stim_path)
             f.write(f"{i+1},{stim_name},{stim_cat}\n")
     return running
 
-def count_occupied_slots(slots):
-    occ_count = 0
-    for slot in slots:
-        if slot["occupied"]:
-            occ_count += 1
-    return occ_count
-
-def move_cursor(index: int, direction: str, total: int, cols: int, images) -> int:
-    rows = int(np.ceil(total / cols))
-    col = index // rows
-    row = index % rows
-
-    # Movement logic
-    if direction == "up" and row > 0: # TODO: change this for the response pad. 
-        row -= 1
-    elif direction == "down" and row < rows - 1:
-        row += 1
-    elif direction == "left" and col > 0:
-        col -= 1
-    elif direction == "right" and col < cols - 1:
-        col += 1
-    else:
-        return index  # no movement
-
-    # Try to find next unplaced image in intended direction
-    # We'll allow a limited number of attempts to avoid infinite loops
-    max_attempts = rows * cols
-    for _ in range(max_attempts):
-        new_index = col * rows + row
-        if new_index >= total:
-            break
-        if not images[new_index]["placed"]:
-            return new_index
-
-        # Move again in same direction
-        if direction == "up" and row > 0:
-            row -= 1
-        elif direction == "down" and row < rows - 1:
-            row += 1
-        elif direction == "left" and col > 0:
-            col -= 1
-        elif direction == "right" and col < cols - 1:
-            col += 1
-        else:
-            break
-
-    # If no unplaced item found, return current index
-    return index
-
-def handle_select_or_place(images, index, selected_image, slots):
-    img = images[index]
-    if img["placed"]:
-        return selected_image
-
-    # Immediately try to place
-    for slot in slots:
-        if not slot["occupied"]:
-            img["stim"].pos = slot["rect"].pos
-            img["placed"] = True
-            img["highlight"].opacity = 0
-            img["current_slot"] = slot
-            slot["occupied"] = True
-            slot["image"] = img
-            return None  # nothing is selected now
-
-    return selected_image
-
-def handle_undo(images):
-    for img in images:
-        if img["placed"]:
-            slot = img["current_slot"]
-            img["stim"].pos = img["orig_pos"]
-            img["placed"] = False
-            img["highlight"].opacity = 0
-            img["current_slot"] = None
-            slot["occupied"] = False
-            slot["image"] = None
-            slot["rect"].opacity = 1
-            break
-
-
 def gen_img_positions(jitter=0.1):
     ''' Generate a grid of image positions with some random jitter '''
     x = np.round(np.linspace(-0.75, 0.75, 6), 2)
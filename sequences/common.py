@@ -9,6 +9,7 @@ def get_win_dict():
         units="norm",
         color=pm.bg_color,
         screen=pm.screen,
+        allowStencil=True, # for the aperture of fl.type_text
     )
     aspect_ratio = win.size[0] / win.size[1]
     background = visual.ImageStim(
@@ -18,4 +19,10 @@ def get_win_dict():
         units="norm"
     )
     d = {"win": win, "background": background, "aspect_ratio": aspect_ratio}
-    return d
\ No newline at end of file
+    return d
+
+def build_static_layer(win, stims:list):
+    '''Pre-composite the stimuli that do not change during a screen (background, texts, ticks...) into a single image,
+    so each frame only draws this layer and the dynamic elements. The back buffer is used for the capture and
+    cleared, so it has to be built before drawing anything else for the next flip.'''
+    return visual.BufferImageStim(win, stim=stims)
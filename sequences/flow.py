@@ -1,24 +1,55 @@
 from psychopy import visual, core, event
 import warnings
+import numpy as np
 
 
 def end_run(tools):
     tools['logger'].info(f"=============== Run {tools['exp_info']['run']} gracefully closed ===============")
     print(f"=============== Run {tools['exp_info']['run']} gracefully closed ===============")
+    if tools.get('prefetcher'):
+        tools['prefetcher'].close()
+    if tools.get('track_player'):
+        tools['track_player'].close()
     tools['win'].close()
     core.quit()
 
+def defer(tools, fun, *args, **kwargs):
+    ''' Queue some work (flushing files, prefetching...) to be run during the next idle screen (breaks)'''
+    tools['deferred'].append(lambda: fun(*args, **kwargs))
+
+def expect(tools, kind, **info):
+    ''' Tell the simulated participant (if any, see sequences/agent.py) what the next response is about'''
+    if tools.get('participant') is not None:
+        tools['participant'].expect(kind, **info)
+
+def scaled_wait(wait_fun, time_scale:float):
+    ''' Wrap a wait function so the durations it is given are divided by time_scale. Polling intervals are passed
+    with scale=False: they set how often the inputs are read, not how long something lasts, and scaling them
+    would turn the polling loops into busy loops.'''
+    def wait(secs, scale:bool=True, **kwargs):
+        return wait_fun(secs / time_scale if scale else secs, **kwargs)
+    return wait
+
+def scale_dur(tools, dur:float)-> float:
+    ''' Duration after the time scale of the session, for the durations measured with a clock'''
+    return dur / tools.get('time_scale', 1)
+
+def flush_logs(logger):
+    ''' Write the buffered log records to disk'''
+    for handler in logger.handlers:
+        handler.flush()
+
 def novov_trigger(pport, trig1, trig2, delay=10):
     ''' Function to send triggers to the parallel port with no overlap.'''
     pport.signal(trig1)
-    core.wait((delay+2)/1000)
+    core.wait((delay+2)/1000) # gap between the pulses required by the hardware, never scaled
     pport.signal(trig2)
     return
 
-def clear_stuff(win):
+def clear_stuff(win, wait_fun=core.wait):
     ''' Remove keyboard events and clear the window '''
     win.flip()
-    core.wait(0.5)
+    wait_fun(0.5)
     event.clearEvents()
 
 def wait_frate(win, objects:list, frate:int, t:int):
@@ -41,7 +72,7 @@ def log_exceptions(message, logger, win):
 
 def check_escape_or_break(tools, pause_key='b'):
     ''' Function to check for the escape key or break key '''
-    keys = event.getKeys()
+    keys = tools['event_fun']()
     if 'escape' in keys:
         print("--- Escape key pressed, exiting... ---")
         if tools['logger']:
@@ -57,20 +88,43 @@ def check_escape_or_break(tools, pause_key='b'):
             tools['logger'].info("Break key pressed again, resuming the experiment ...")
 
     
+typing_style = {'font': "Arial", 'alignment': "center", 'anchor': "center", 'size': (1.5, None), 'units': "norm"}
+
 def type_text(text, win, color="black", height=0.08, background=None, t=0.03):
-    ''' Function to display typing effect '''
-    displayed_text = ""  # Start with an empty string
-    for letter in text:
-        displayed_text += letter
-        text_stim = visual.TextStim(
-            win, text=displayed_text, font="Arial", color=color, 
-            height=height, alignText="center", wrapWidth=1.5, units="norm"
-        )
+    ''' Function to display typing effect. The text is laid out once (a TextBox2) and drawn under an aperture
+    whose edge follows the caret, so revealing a character only moves the aperture. The characters are revealed
+    on a frame schedule: one character every t seconds, at most one per frame. The window needs a stencil buffer.'''
+    text_stim = visual.TextBox2(win, text=text, color=color, letterHeight=height, **typing_style)
+    cutoffs = reveal_cutoffs(text_stim)
+    aperture = visual.Aperture(win, shape=reveal_shape(win.size, text_stim.letterHeightPix), units='pix')
+    aperture.enabled = False
+    frame_dur = win.monitorFramePeriod
+    frames_per_char = max(1, round(t / frame_dur))
+    for frame in range(len(cutoffs) * frames_per_char):
         if background:
             background.draw()
+        aperture.pos = cutoffs[frame // frames_per_char] # draws the aperture of this frame and enables it
         text_stim.draw()
+        aperture.enabled = False
         win.flip()
-        core.wait(t)
+
+def reveal_cutoffs(text_stim)-> np.ndarray:
+    ''' Position (pix) of the aperture after each character of a laid-out TextBox2: the caret x and the top of
+    the band of its row, 0.9 letter height above the row bottom'''
+    caret = text_stim.caret
+    cutoffs = []
+    for n in range(1, len(text_stim.visibleText)+1):
+        caret.index = n
+        (x, bottom), _ = caret.vertices
+        cutoffs.append((x, bottom + 0.9 * text_stim.letterHeightPix))
+    return np.array(cutoffs)
+
+def reveal_shape(win_size, letter_px:float)-> np.ndarray:
+    ''' Vertices (pix, relative to the cutoff) of the revealed region: everything above the band of the current
+    row, and the band up to the cutoff. The band goes 0.3 letter height under the row bottom for the descenders.'''
+    w, h = 2 * np.asarray(win_size, dtype=float)
+    band = 1.2 * letter_px
+    return np.array([[-w, h], [w, h], [w, 0], [0, 0], [0, -band], [-w, -band]])
 
 def check_user_info(exp_info, logger=None):
     '''Check if user has entered all the necessary information'''
@@ -0,0 +1,262 @@
+import sys
+import types
+import random
+import importlib
+from collections import Counter
+import numpy as np
+import sequences.params as pm
+
+# headless backend: window, stimuli, sounds, keyboard, dialog and triggers are replaced by recorders running on a
+# virtual clock, so a full session runs without a screen, a GPU or an audio device and as fast as the CPU allows.
+# install() has to be called before importing pipeline (or any module that imports psychopy.visual).
+
+frate = 60.
+session_info = {} # values entered in the participant dialog, e.g. {'ID': '99', 'run': '01', 'lang': 'fr'}
+counters = Counter()
+events = [] # (time, kind, value) of the triggers sent and sounds played
+_now = [0.]
+
+class SessionEnd(BaseException):
+    ''' Raised instead of quitting the process. error is the exception being handled when quit was called, if any.'''
+
+    def __init__(self, error=None):
+        super().__init__(error)
+        self.error = error
+
+def get_time()-> float:
+    return _now[0]
+
+def wait(secs:float, hogCPUperiod:float=0.2):
+    ''' Waiting only moves the virtual clock'''
+    if secs > 0:
+        _now[0] += secs
+
+def quit():
+    raise SessionEnd(sys.exc_info()[1])
+
+class Clock:
+
+    def __init__(self):
+        self._t0 = get_time()
+
+    def getTime(self)-> float:
+        return get_time() - self._t0
+
+    def reset(self, newT:float=0.):
+        self._t0 = get_time() + newT
+
+class RandomKeys:
+    ''' Default input: each poll returns one key drawn from the response keys, waitKeys returns its first allowed key.
+    Every loop of the task ends because a confirm key comes eventually.'''
+
+    def __init__(self, keys:list=None, seed:int=0):
+        if keys is None:
+            keys = set(pm.key_dict.values()) | set(pm.key_bq.values())
+            keys.discard(pm.key_dict['pause'])
+        self.keys = sorted(keys)
+        self.rng = random.Random(seed)
+
+    def get_keys(self, key_list=None)-> list:
+        return [self.rng.choice(self.keys)]
+
+    def wait_keys(self, key_list=None)-> list:
+        if key_list is None:
+            return self.get_keys()
+        if isinstance(key_list, str):
+            key_list = [key_list]
+        return [key_list[0]]
+
+keys = RandomKeys()
+
+class Window:
+    ''' Flipping moves the virtual clock to the next refresh and calls the functions registered with callOnFlip'''
+
+    def __init__(self, size=(1920, 1080), **kwargs):
+        self.__dict__.update(kwargs)
+        self.size = np.array(size)
+        self.monitorFramePeriod = 1 / frate
+        self.mouseVisible = True
+        self._to_call = []
+
+    def callOnFlip(self, function, *args, **kwargs):
+        self._to_call.append((function, args, kwargs))
+
+    def flip(self, clearBuffer:bool=True)-> float:
+        n_frames = int(np.floor(get_time() * frate + 1e-6)) + 1
+        _now[0] = n_frames / frate
+        flip_time = _now[0] # like psychopy, the time stamp is taken before the functions are called
+        to_call, self._to_call = self._to_call, []
+        for function, args, kwargs in to_call:
+            function(*args, **kwargs)
+        counters['flips'] += 1
+        return flip_time
+
+    def getActualFrameRate(self, **kwargs)-> float:
+        return frate
+
+    def close(self):
+        counters['windows_closed'] += 1
+
+class Stim:
+    ''' Stand-in for every psychopy stimulus: keeps the attributes it is given and counts the draws.
+    Attributes that were never set read as None.'''
+
+    def __init__(self, win=None, **kwargs):
+        self.win = win
+        self.opacity = 1
+        self.pos = (0, 0)
+        self.__dict__.update(kwargs)
+        counters[f'alloc_{type(self).__name__}'] += 1
+
+    def __getattr__(self, name:str):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return None
+
+    def draw(self, win=None):
+        counters['draws'] += 1
+
+def _stim_class(name:str):
+    return type(name, (Stim,), {})
+
+class TextBox2(Stim):
+    ''' Laid out on a fixed grid: 10 px per character, 20 px letters, rows 30 px apart'''
+
+    def __init__(self, win=None, text:str='', **kwargs):
+        super().__init__(win, text=text, **kwargs)
+        self.letterHeightPix = 20.
+        self.caret = Caret(self)
+
+    @property
+    def visibleText(self)-> str:
+        return self.text
+
+class Caret:
+
+    def __init__(self, textbox:TextBox2):
+        self.textbox = textbox
+        self.index = len(textbox.text)
+
+    @property
+    def vertices(self)-> np.ndarray:
+        rows = self.textbox.text[:self.index].split('\n')
+        x, bottom = 10. * len(rows[-1]), -30. * (len(rows) - 1)
+        return np.array([[x, bottom], [x, bottom + self.textbox.letterHeightPix]])
+
+class Sound:
+
+    def __init__(self, value=None, **kwargs):
+        self.value = str(value)
+        self.sample_rate = 44100
+        self.signal = np.zeros(4410, dtype=np.float32) # 0.1 s of silence
+        counters['sounds_loaded'] += 1
+
+    def play(self, when:float=None, **kwargs):
+        if when is not None:
+            assert 0 < when, 'when must be a strictly positive delay (s), like in the stimuli backend'
+        events.append((get_time() + (when or 0), 'sound', self.value))
+
+    def stop(self):
+        pass
+
+class OutputStream:
+    ''' sounddevice output stream on the virtual clock. The callback is never called: the streams are only counted.'''
+
+    def __init__(self, samplerate:float=None, channels:int=None, callback=None, **kwargs):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.callback = callback
+        self.latency = 0.01
+        self.active = False
+        counters['streams_opened'] += 1
+
+    @property
+    def time(self)-> float:
+        return get_time()
+
+    def start(self):
+        self.active = True
+
+    def stop(self):
+        self.active = False
+
+    def close(self):
+        self.active = False
+
+class Keyboard:
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def waitKeys(self, keyList=None, **kwargs)-> list:
+        return keys.wait_keys(keyList)
+
+    def getKeys(self, keyList=None, **kwargs)-> list:
+        return keys.get_keys(keyList)
+
+class DlgFromDict:
+    ''' Fills the dictionary with session_info instead of asking'''
+
+    def __init__(self, dictionary:dict, *args, **kwargs):
+        dictionary.update(session_info)
+        self.OK = True
+
+class TriggerRecorder:
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def signal(self, value:int):
+        events.append((get_time(), 'trigger', value))
+
+def _module(name:str, **attrs)-> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+def install(seed:int=0):
+    ''' Replace the display, input, audio and trigger interfaces. Only the psychopy core module has to be
+    importable: its clock functions are patched, the other modules are replaced.'''
+    import psychopy
+    from psychopy import core
+    global keys
+    keys = RandomKeys(seed=seed)
+
+    core.getTime = get_time
+    core.wait = wait
+    core.quit = quit
+    core.Clock = Clock
+
+    stim_names = ['ImageStim', 'TextStim', 'Rect', 'BufferImageStim', 'ElementArrayStim', 'GratingStim', 'Aperture']
+    psychopy.visual = _module('psychopy.visual', Window=Window, TextBox2=TextBox2,
+        **{name: _stim_class(name) for name in stim_names})
+    psychopy.event = _module('psychopy.event',
+        getKeys=lambda keyList=None, **kwargs: keys.get_keys(keyList),
+        waitKeys=lambda keyList=None, **kwargs: keys.wait_keys(keyList),
+        clearEvents=lambda eventType=None: None,
+    )
+    psychopy.gui = _module('psychopy.gui', DlgFromDict=DlgFromDict)
+    for parent in ['psychopy.hardware', 'stimuli']: # device packages may not import without the hardware
+        try:
+            importlib.import_module(parent)
+        except Exception:
+            _module(parent)
+    sys.modules['psychopy.hardware'].keyboard = _module('psychopy.hardware.keyboard', Keyboard=Keyboard)
+    sys.modules['stimuli'].audio = _module('stimuli.audio', Sound=Sound)
+    _module('sounddevice', OutputStream=OutputStream)
+
+    import byte_triggers
+    byte_triggers.MockTrigger = TriggerRecorder
+    pm.use_mock_port = True
+
+def stats()-> dict:
+    ''' Counters of the session and number of triggers and sounds, with the virtual duration'''
+    kinds = Counter(kind for _, kind, _ in events)
+    return {**counters, 'triggers': kinds['trigger'], 'sounds_played': kinds['sound'], 'virtual_time': get_time()}
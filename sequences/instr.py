@@ -1,14 +1,33 @@
 from pathlib import Path
 import os
+from typing import Dict
 from sequences.params import input_dir, instr_fnames
 
+default_lang = 'fr'
+registry = {} # {lang: {instr_fn: txt}}, filled once by load_registry()
+
+def load_registry()-> Dict[str, Dict[str, str]]:
+    ''' Load all the instruction texts of all languages in memory. A file missing in a language
+    falls back to the french version, so lookups never touch the disk.'''
+    instr_dir = Path(f"{input_dir}/instructions")
+    langs = sorted(lang for lang in os.listdir(instr_dir) if (instr_dir / lang).is_dir())
+    registry.clear()
+    for lang in langs:
+        registry[lang] = {}
+        for instr_fn, fn in instr_fnames.items():
+            for candidate in (lang, default_lang):
+                path = instr_dir / candidate / fn
+                if path.exists():
+                    registry[lang][instr_fn] = read_instr(path)
+                    break
+    return registry
+
 def get_txt(lang:str, instr_fn:str)-> str:
-    ''' Load instruction text from file '''
-    lang = lang if lang in os.listdir(f"{input_dir}/instructions") else 'fr' # default to french
-    fn = instr_fnames[instr_fn]
-    fn = Path(f"{input_dir}/instructions/{lang}/{fn}")
-    txt = read_instr(fn)
-    return txt
+    ''' Load instruction text from the registry '''
+    if not registry:
+        load_registry()
+    lang = lang if lang in registry else default_lang # default to french
+    return registry[lang][instr_fn]
 
 def read_instr(fn:str)-> str:
     ''' Read instruction text from file '''
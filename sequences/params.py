@@ -15,6 +15,7 @@ sound0_fn = Path(f'{input_dir}/sounds/reward.wav')
 snd_endPause_fn = Path(f'{input_dir}/sounds/end_pause.wav')
 fix_img_fn = Path(f"{input_dir}/fix/fix.png")
 q_reward_fn = [Path(f'{input_dir}/sounds/reward{i}.wav') for i in range(1, 4)]
+snd_cache_dir = Path(f'{input_dir}/sounds/.cache') # sounds converted to the format of the audio device, see build_sound_cache.py
 instr_fnames = {
     'instr1_fn': 'instructions_p1.txt',
     'instr2_fn' : 'instructions_p2.txt',
@@ -57,6 +58,8 @@ key_bq = {
 t = 0.001 # speed of text presentation
 #seed = 42
 frate = 120 
+audio_latency = 0.05 # output latency of the audio device (s), sounds are scheduled at least this far ahead
+audio_margin = 0.002 # extra lead (s) for the time between the onset prediction and the call to play
 bg_color = (255, 255, 255)
 text_height = 0.08
 img_size = 0.4
@@ -116,6 +119,10 @@ seq_structures = {
     'L': [5, 0, 4, 3, 1, 2],
 }
 
+# all the durations are divided by time_scale (e.g. 10 runs a session 10 times faster, for pilots and QA)
+time_scale = 1
+debug_time_scale = 50 # used instead of time_scale in debugging mode
+
 # sequence presentation timings
 isi_dur = 1.5
 stim_dur = 0.3 # + 50 ms in the actual presentation
@@ -130,6 +137,7 @@ t_act = 2
 t_fb = 1
 t_iqi = 0.5
 t_post_q = 5
+t_poll = 0.002 # input polling interval when nothing changes on screen
 
 q_img_size = 0.2
 q_slot_size = q_img_size + 0.001
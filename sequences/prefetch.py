@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from PIL import Image
+
+# tools to load and decode the stimuli in the background, while the fixation cross is on screen
+
+def decode_image(path:str)-> Image.Image:
+    ''' Read and decode an image file. The pixels are loaded here so nothing is left to do at draw time.'''
+    with Image.open(path) as img:
+        img = img.convert('RGBA')
+        img.load()
+    return img
+
+class StimPrefetcher:
+    ''' Decode images in a worker thread and keep them in a small cache.
+    Only the decoding happens off-thread: textures are uploaded by the render thread (OpenGL is not thread safe).
+    If an AssetStore is given, images are cached by content so identical files are decoded once.'''
+
+    def __init__(self, max_items:int=64, store=None):
+        self.max_items = max_items
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+        self._futures = OrderedDict()
+
+    def prefetch(self, paths:List[str]):
+        ''' Schedule the decoding of the images. Returns immediately.'''
+        for path in paths:
+            key = self._key(path)
+            if key in self._futures:
+                self._futures.move_to_end(key)
+                continue
+            source = self.store.source(path) if self.store else str(path)
+            self._futures[key] = self._executor.submit(decode_image, source)
+        while len(self._futures) > self.max_items: # drop the oldest entries
+            self._futures.popitem(last=False)
+
+    def get(self, path:str)-> Image.Image:
+        ''' Return the decoded image. Blocks only if the image was not prefetched (or is still decoding).'''
+        key = self._key(path)
+        if key not in self._futures:
+            self.prefetch([path])
+        return self._futures[key].result()
+
+    def _key(self, path:str)-> str:
+        return self.store.key(path) if self.store else str(path)
+
+    def close(self):
+        ''' Stop the worker thread and clear the cache.'''
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._futures.clear()
@@ -0,0 +1,359 @@
+from collections import Counter
+from typing import Dict, List, Tuple
+import numpy as np
+from PIL import Image
+from psychopy import visual, core
+import sequences.params as pm
+import sequences.stimuli_manager as sm
+from sequences.prefetch import decode_image
+
+# pre-built stimuli for the sequence presentation and the in-task questions
+
+class PresentationPool:
+    ''' Stimuli of the sequence presentation, built once per run. Presenting a stimulus only swaps the
+    image of a pre-built ImageStim. The counters tell how many objects were built and how many images were swapped.'''
+
+    def __init__(self, win, aspect_ratio:float, n_stims:int=pm.n_seq):
+        self.counters = Counter()
+        self.stim_images = [
+            self._alloc('image', visual.ImageStim, win=win, image=None, size=(pm.img_size, pm.img_size*aspect_ratio))
+            for _ in range(n_stims)
+        ]
+        # rectangle for photodiode
+        self.rect = self._alloc('rect', visual.Rect,
+            win=win,
+            width=0.05,
+            height=0.05*aspect_ratio,
+            pos=(1, 1),
+            units='norm',
+            fillColor=(255, 255, 255),
+        )
+        self.fix_cross = self._alloc('fix_cross', visual.TextStim,
+            win=win,
+            text='+',
+            font='Arial',
+            height=0.1,
+            color='black',
+            units='norm'
+        )
+
+    def _alloc(self, name:str, cls, **kwargs):
+        self.counters[f'alloc_{name}'] += 1
+        return cls(**kwargs)
+
+    def load(self, images:list)-> List[visual.ImageStim]:
+        ''' Swap the images of the pooled stims (decoded images or paths). Has to be called from the render thread.'''
+        if len(images) > len(self.stim_images):
+            raise ValueError(f"Pool has {len(self.stim_images)} image stims, {len(images)} requested")
+        for stim, img in zip(self.stim_images, images):
+            stim.image = img
+            self.counters['image_updates'] += 1
+        return self.stim_images[:len(images)]
+
+    def stats(self)-> Dict[str, int]:
+        ''' Allocation and update counters'''
+        return dict(self.counters)
+
+class QuestionScreen:
+    ''' Widgets of the in-task question (slots, cue and target images and photodiode rect),
+    built once with the window. Each question only swaps the images and resets the state.'''
+
+    def __init__(self, win, aspect_ratio:float):
+        slot_positions = sm.get_slot_pos(y_pos=pm.y_pos)
+        self.slots = [
+            {
+                "rect": visual.Rect(
+                    win,
+                    width=pm.q_slot_size,
+                    height=pm.q_slot_size * aspect_ratio,
+                    pos=pos,
+                    lineColor="black",
+                    fillColor=(105, 105, 105)),
+                "highlight": visual.Rect(
+                    win,
+                    width=pm.hl_size,
+                    height=pm.hl_size * aspect_ratio,
+                    pos=pos,
+                    lineColor="blue",
+                    lineWidth=5,
+                    opacity=0,
+                ),
+                "selected": False,
+            }
+            for pos in slot_positions
+        ]
+        self.target_seq_pos = (0, -pm.y_pos)
+        self.cue_viz = visual.ImageStim(win, image=None, pos=(0, 0), size=(pm.img_size, pm.img_size * aspect_ratio))
+        self.cue_seq = visual.ImageStim(win, image=None, pos=(-0.75, pm.y_pos), size=(pm.q_img_size, pm.q_img_size * aspect_ratio))
+        self.target_viz = visual.ImageStim(win, image=None, pos=(0, 0), size=(pm.img_size, pm.img_size * aspect_ratio))
+        self.target_seq = visual.ImageStim(win, image=None, pos=self.target_seq_pos, size=(pm.q_img_size, pm.q_img_size * aspect_ratio))
+        # rectangle for photodiode
+        self.rect = visual.Rect(
+            win=win,
+            width=0.1,
+            height=0.1*aspect_ratio,
+            pos=(1, 1),
+            units='norm',
+            fillColor=(255, 255, 255),
+        )
+
+    def prepare(self, cue_img, target_img):
+        ''' Swap the cue and target images and reset what the previous question modified.'''
+        self.cue_viz.image = cue_img
+        self.cue_seq.image = cue_img
+        self.target_viz.image = target_img
+        self.target_seq.image = target_img
+        self.cue_viz.opacity = 1 # faded out in the previous question
+        self.target_seq.pos = self.target_seq_pos # moved to the selected slot in the previous question
+        for slot in self.slots:
+            slot["highlight"].opacity = 0
+            slot["selected"] = False
+
+class TextCache:
+    ''' TextStims of the messages known in advance, keyed by message and style (the TextStim arguments). They are
+    laid out once (at startup), so presenting a message does no glyph layout.'''
+
+    def __init__(self, win):
+        self.win = win
+        self.defaults = {'font': 'Arial', 'color': 'black', 'height': pm.text_height, 'units': 'norm'}
+        self.stims = {}
+        self.misses = 0
+
+    def key(self, text:str, **kwargs)-> tuple:
+        ''' Message and complete style (defaults included), lists made hashable'''
+        style = {**self.defaults, **kwargs}
+        return text, tuple(sorted((name, tuple(v) if isinstance(v, list) else v) for name, v in style.items()))
+
+    def add(self, text:str, **kwargs)-> visual.TextStim:
+        ''' Lay out a message (kwargs override the default TextStim arguments)'''
+        stim = visual.TextStim(self.win, text=text, **{**self.defaults, **kwargs})
+        self.stims[self.key(text, **kwargs)] = stim
+        return stim
+
+    def get(self, text:str, **kwargs)-> visual.TextStim:
+        ''' Return the cached message in this style. A message that was not prepared is laid out now (and counted
+        as a miss).'''
+        key = self.key(text, **kwargs)
+        if key not in self.stims:
+            self.misses += 1
+            return self.add(text, **kwargs)
+        return self.stims[key]
+
+# durations of params that are presented as frame counts (engine.frames). The jittered durations (stim + isi,
+# tmr delay) are converted with n_frames() once the jitter is drawn, the cue fade out with n_frames(t_viz_cue).
+# t_act is a response timeout, measured with a clock.
+frame_locked_durations = [
+    't_prep', 't_viz_target', 't_fb', 't_iqi', 't_post_q', 't_post_block', 't_rotate', 't_post_run',
+    't_reward_info', 't_tmr_delay',
+]
+
+def measure_frate(win, default:float=pm.frate)-> float:
+    ''' Measure the refresh rate of the screen. Falls back to params.frate if the measure is not stable.'''
+    frate = win.getActualFrameRate(nIdentical=20, nMaxFrames=240, nWarmUpFrames=20, threshold=1)
+    return frate if frate else default
+
+def to_frames(dur:float, frate:float)-> int:
+    ''' Convert a duration in seconds to a number of refreshes. A positive duration lasts at least one refresh,
+    even when it is shorter than a frame (e.g. with a large time scale).'''
+    if dur <= 0:
+        return 0
+    return max(1, int(round(dur * frate)))
+
+def flicker_table(n_frames:int, freq:float, frate:float)-> np.ndarray:
+    ''' Opacity of a smooth flicker at freq Hz for each of n_frames refreshes'''
+    t = np.arange(n_frames) / frate
+    return 0.5 * (1 + np.sin(2 * np.pi * freq * t))
+
+class FrameEngine:
+    ''' Presents screens for a number of refreshes instead of waiting, so onsets are locked to the flips.
+    Dropped frames are counted from the flip timestamps. Durations are divided by time_scale.'''
+
+    def __init__(self, win, frate:float, time_scale:float=1, audio_latency:float=pm.audio_latency,
+            audio_margin:float=pm.audio_margin):
+        self.win = win
+        self.frate = frate
+        self.frame_dur = 1 / frate
+        self.time_scale = time_scale
+        self.audio_latency = audio_latency
+        self.audio_margin = audio_margin
+        self.frames = {name: self.n_frames(getattr(pm, name)) for name in frame_locked_durations}
+        self.last_flip = None # timestamp of the last flip done by the engine
+        self.onset = None # timestamp of the onset flip of the last screen
+        self.screen = [] # objects of the last screen
+        # scheduled audio onset - visual onset of each stimulus with a sound, in seconds. The backend does not report
+        # when the sound actually leaves the device, so this is the error of the flip prediction, not a measured offset
+        self.av_prediction_errors = []
+
+    def n_frames(self, dur:float)-> int:
+        return to_frames(dur / self.time_scale, self.frate)
+
+    def present(self, objects:list, n_frames:int, task=None)-> int:
+        ''' Draw the objects for n_frames refreshes. The first flip is the onset (functions registered with
+        win.callOnFlip are called there). task is run right after the onset flip; the refreshes it takes count
+        as elapsed, so the end of the screen does not move. Returns the number of dropped frames.'''
+        self.onset = None # never left over from the previous screen
+        if n_frames <= 0:
+            return 0
+        self.screen = objects
+        for obj in objects:
+            obj.draw()
+        onset = self.win.flip()
+        self.onset = onset
+        planned = 0 # refreshes skipped on purpose by the task
+        if task is not None:
+            task()
+            planned = int((core.getTime() - onset) / self.frame_dur)
+        n_flips = 1
+        frame = 1
+        t = onset
+        while frame < n_frames:
+            for obj in objects:
+                obj.draw()
+            t = self.win.flip()
+            n_flips += 1
+            frame = int(round((t - onset) / self.frame_dur)) + 1
+        self.last_flip = t
+        return max(0, frame - n_flips - planned)
+
+    def idle(self, draw, n_frames:int, frames_per_update:int, tasks=None)-> int:
+        ''' Low-CPU presentation of a long screen that changes slowly (breaks). draw(i) draws the i-th state and the
+        window is only flipped when the state changes, every frames_per_update refreshes. In between, the deferred
+        tasks (a deque of callables, which should be short) are run one at a time, then the thread sleeps until
+        the next update. Returns the number of tasks that were run.'''
+        n_done = 0
+        n_updates = int(np.ceil(n_frames / frames_per_update)) if frames_per_update > 0 else 1
+        onset = None
+        for i in range(n_updates):
+            draw(i)
+            t = self.win.flip()
+            self.last_flip = t
+            if onset is None:
+                onset = t
+            # wake up one refresh before the next update, the flip waits for the retrace
+            next_frame = min((i + 1) * frames_per_update, n_frames) if frames_per_update > 0 else n_frames
+            wake = onset + (next_frame - 1) * self.frame_dur
+            while tasks and core.getTime() < wake:
+                tasks.popleft()()
+                n_done += 1
+            remaining = wake - core.getTime() # a deadline on the frame grid, already scaled
+            if remaining > 0:
+                core.wait(remaining, hogCPUperiod=0)
+        return n_done
+
+    def resync(self, objects:list)-> float:
+        ''' Flip the objects (what is on screen, or the background) to get the current refresh grid.
+        Returns the flip timestamp.'''
+        for obj in objects:
+            obj.draw()
+        self.last_flip = self.win.flip()
+        return self.last_flip
+
+    def next_flip(self, lead:float=0., now:float=None)-> float:
+        ''' Predicted time of the first flip at least lead seconds after now, on the grid of the last flip'''
+        if now is None:
+            now = core.getTime()
+        last = self.last_flip if self.last_flip is not None else now
+        n = max(1, int(np.ceil((now + lead - last) / self.frame_dur)))
+        return last + n * self.frame_dur
+
+    def schedule_sound(self, snd, hold:list)-> float:
+        ''' Start a sound with the timed start of the audio backend on a predicted flip, and show the hold objects
+        (what is on screen, or the background) until the flip before it: the next present() starts on that flip.
+        The grid is resynced with a flip of hold right before the prediction, and the onset is the first flip at
+        least one output latency plus a safety margin ahead of a single time stamp. Has to be called right before
+        present() and before the functions of its onset flip are registered with win.callOnFlip (nothing slow in
+        between). Returns the scheduled onset.'''
+        self.resync(hold)
+        lead = self.audio_latency + self.audio_margin
+        now = core.getTime()
+        onset = self.next_flip(lead, now)
+        if onset - now < lead: # on a refresh up to rounding: skip one more frame
+            onset += self.frame_dur
+        snd.play(when=onset - now)
+        while self.next_flip() < onset - self.frame_dur / 2:
+            self.resync(hold)
+        return onset
+
+    def av_stats(self)-> Dict[str, float]:
+        ''' Number of scheduled sounds and mean / max absolute error of the predicted onset flip (ms)'''
+        if not self.av_prediction_errors:
+            return {'n': 0}
+        offsets = np.abs(self.av_prediction_errors) * 1000
+        return {'n': len(offsets), 'mean_ms': round(float(offsets.mean()), 3), 'max_ms': round(float(offsets.max()), 3)}
+
+# texture atlases: several images packed in one texture, an element shows one tile through its phase.
+# Each tile is surrounded by pad pixels repeating its own border, so the linear filtering at the edge of a tile
+# never reads the neighbouring tile. The texture is a power of 2 on each side (psychopy would resize it otherwise).
+
+def next_pow2(x:int)-> int:
+    return int(2 ** np.ceil(np.log2(x)))
+
+def tile_size(path:str, tile_px:int=None)-> Tuple[int, int]:
+    ''' Size of the tiles: the size of the image, scaled so its longest side is tile_px (native size if None)'''
+    with Image.open(path) as img:
+        w, h = img.size
+    if tile_px is None:
+        return w, h
+    scale = tile_px / max(w, h)
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+def atlas_size(n:int)-> int:
+    ''' Number of tiles per side for n images'''
+    return int(np.ceil(np.sqrt(n)))
+
+def atlas_shape(n_tiles:int, tile:Tuple[int, int], pad:int=2)-> Tuple[int, int]:
+    ''' Width and height of the texture'''
+    return next_pow2(n_tiles * (tile[0] + 2 * pad)), next_pow2(n_tiles * (tile[1] + 2 * pad))
+
+def build_atlas(paths:List[str], n_tiles:int, tile:Tuple[int, int], pad:int=2)-> Image.Image:
+    ''' Pack the images in one texture, image i in the tile at column i % n_tiles and row i // n_tiles'''
+    w, h = tile
+    atlas = Image.new('RGBA', atlas_shape(n_tiles, tile, pad), (255, 255, 255, 0))
+    for i, path in enumerate(paths):
+        img = decode_image(path)
+        x, y = (i % n_tiles) * (w + 2 * pad), (i // n_tiles) * (h + 2 * pad)
+        atlas.paste(img.resize((w + 2 * pad, h + 2 * pad), Image.LANCZOS), (x, y)) # padding: stretched border
+        atlas.paste(img.resize((w, h), Image.LANCZOS), (x + pad, y + pad))
+    return atlas
+
+def atlas_coords(n:int, n_tiles:int, tile:Tuple[int, int], pad:int=2)-> Tuple[np.ndarray, np.ndarray]:
+    ''' Phase that centers each of the n tiles, and the fraction of the texture (x, y) covered by a tile:
+    a stim of size s shows a single tile with sf = fraction / s. Psychopy centers the texture of a stim on
+    0.5 - phase, with v going up (the image is flipped).'''
+    w, h = tile
+    width, height = atlas_shape(n_tiles, tile, pad)
+    cols, rows = np.arange(n) % n_tiles, np.arange(n) // n_tiles
+    cx = (cols * (w + 2 * pad) + pad + w / 2) / width
+    cy = (rows * (h + 2 * pad) + pad + h / 2) / height
+    return np.column_stack([0.5 - cx, cy - 0.5]), np.array([w / width, h / height])
+
+class SpriteSheet:
+    ''' Animation frames packed in one texture and shown through a single GratingStim.
+    Changing frame only moves the texture coordinates, no image is uploaded.'''
+
+    def __init__(self, win, paths:List[str], size, tile_px:int=None, units:str='norm'):
+        self.n = len(paths)
+        n_tiles = atlas_size(self.n)
+        tile = tile_size(paths[0], tile_px) # the frames keep their resolution and aspect ratio by default
+        size = np.asarray(size, dtype=float)
+        self.phases, fraction = atlas_coords(self.n, n_tiles, tile)
+        self.current = 0
+        self.stim = visual.GratingStim(
+            win,
+            tex=build_atlas(paths, n_tiles, tile),
+            mask=None,
+            size=size,
+            sf=fraction / size,
+            phase=self.phases[0],
+            units=units,
+        )
+
+    def set_frame(self, i:int):
+        ''' Show frame i (modulo the number of frames)'''
+        i %= self.n
+        if i != self.current:
+            self.current = i
+            self.stim.phase = self.phases[i]
+
+    def draw(self):
+        self.stim.draw()
@@ -0,0 +1,141 @@
+import glob
+import os
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+import sounddevice as sd
+from stimuli.audio import Sound
+import sequences.params as pm
+from sequences.assets import hash_file
+
+# sounds of the session, decoded once at startup and shared by the trials, the breaks and the TMR
+
+def session_sound_paths(snd_dir:str=pm.snd_stim_dir)-> List[str]:
+    ''' Paths of all the sounds a session can play: the sequence sounds, the reward sounds and the end of pause sound'''
+    seq_sounds = sorted(glob.glob(os.path.join(snd_dir, '*.wav')))
+    return seq_sounds + [str(fn) for fn in [pm.sound0_fn, pm.snd_endPause_fn, *pm.q_reward_fn]]
+
+def cached_path(path:str, cache_dir:str)-> str:
+    ''' Path of the converted copy of a sound (see build_sound_cache.py), None if there is none'''
+    cached = os.path.join(cache_dir, f'{hash_file(path)}.wav')
+    return cached if os.path.exists(cached) else None
+
+class SoundBank:
+    ''' One ready-to-play Sound per file, keyed by path. Files are decoded when they are added, so getting a sound
+    during the task does no file access. A sound that was not added is loaded on demand (and counted as a miss).
+    If cache_dir is given, the copies converted to the format of the audio device are read instead of the sources.'''
+
+    def __init__(self, paths:List[str]=(), cache_dir:str=None):
+        self.sounds = {}
+        self.cache_dir = cache_dir
+        self.load_time = 0.
+        self.misses = 0
+        self.n_cached = 0
+        for path in paths:
+            self.add(path)
+
+    def add(self, path:str)-> Sound:
+        ''' Decode a sound file (once)'''
+        key = str(path)
+        if key not in self.sounds:
+            start = time.perf_counter()
+            source = cached_path(path, self.cache_dir) if self.cache_dir and os.path.isdir(self.cache_dir) else None
+            if source is not None:
+                self.n_cached += 1
+            self.sounds[key] = Sound(source or path)
+            self.load_time += time.perf_counter() - start
+        return self.sounds[key]
+
+    def get(self, path:str)-> Sound:
+        ''' Return the sound of a file'''
+        if str(path) not in self.sounds:
+            self.misses += 1
+        return self.add(path)
+
+    def get_all(self, paths:Dict[str, str])-> Dict[str, Sound]:
+        ''' Sounds of a {name: path} mapping, e.g. the sound organization of the sequences'''
+        return {name: self.get(path) for name, path in paths.items()}
+
+    def stats(self)-> Dict[str, float]:
+        ''' Number of sounds (and of converted copies used), memory used by the decoded signals (bytes),
+        total load time (s) and misses'''
+        nbytes = sum(getattr(getattr(snd, 'signal', None), 'nbytes', 0) for snd in self.sounds.values())
+        return {'sounds': len(self.sounds), 'cached': self.n_cached, 'bytes': nbytes, 'load_time': round(self.load_time, 3),
+            'misses': self.misses}
+
+def sound_format(snd:Sound)-> Tuple[int, int]:
+    ''' Sample rate and number of channels of a decoded sound'''
+    return snd.sample_rate, 1 if snd.signal.ndim == 1 else snd.signal.shape[1]
+
+class TrackPlayer:
+    ''' Output stream of the session, opened once and kept running: it plays silence until a track is given to
+    play(), whose first sample is then written at the DAC time of the scheduled onset. Starting a track only swaps
+    a reference read by the audio callback, no device object is built or torn down during the task.'''
+
+    def __init__(self, sample_rate:int, n_channels:int, device:int=None, latency='low'):
+        self.sample_rate = sample_rate
+        self.n_channels = n_channels
+        self.n_played = 0
+        self._current = None # (signal, stream time of its first sample), replaced as a whole by play()
+        self.stream = sd.OutputStream(samplerate=sample_rate, channels=n_channels, dtype='float32', device=device,
+            latency=latency, callback=self._callback)
+        self.stream.start()
+
+    @property
+    def latency(self)-> float:
+        ''' Output latency of the stream (s)'''
+        return self.stream.latency
+
+    def play(self, signal:np.ndarray, when:float):
+        ''' Play a float32 signal (samples x channels) when seconds from now'''
+        assert 0 < when, 'when must be a strictly positive delay (s)'
+        self._current = (signal, self.stream.time + when)
+        self.n_played += 1
+
+    def stop(self):
+        self._current = None
+
+    def _callback(self, outdata:np.ndarray, frames:int, time_info, status):
+        outdata.fill(0)
+        current = self._current
+        if current is None:
+            return
+        signal, start = current
+        first = int(round((time_info.outputBufferDacTime - start) * self.sample_rate)) # sample at the buffer start
+        src = max(first, 0)
+        dst = src - first
+        n = min(frames - dst, len(signal) - src)
+        if n > 0:
+            outdata[dst:dst + n] = signal[src:src + n]
+
+    def close(self):
+        self.stream.stop()
+        self.stream.close()
+
+class SequenceTrack:
+    ''' Pre-mixed track of a sequence: the signal of its sound repeated at the planned onsets of the stimuli
+    (seconds from the first one), so the whole sequence is played with a single start on the player's stream.'''
+
+    def __init__(self, signal:np.ndarray, sample_rate:int, onsets:List[float], player:TrackPlayer):
+        if sample_rate != player.sample_rate:
+            raise ValueError(f'Sound at {sample_rate} Hz, the output stream runs at {player.sample_rate} Hz '
+                '(convert the sounds with build_sound_cache.py)')
+        signal = np.asarray(signal, dtype=np.float32)
+        if signal.ndim == 1:
+            signal = signal[:, np.newaxis]
+        if signal.shape[1] != player.n_channels:
+            signal = np.repeat(signal.mean(axis=1, keepdims=True), player.n_channels, axis=1)
+        self.player = player
+        self.sample_rate = sample_rate
+        self.onsets = np.asarray(onsets, dtype=float)
+        starts = np.round(self.onsets * sample_rate).astype(int)
+        self.signal = np.zeros((starts[-1] + len(signal), signal.shape[1]), dtype=np.float32)
+        for start in starts:
+            self.signal[start:start + len(signal)] += signal
+        np.clip(self.signal, -1, 1, out=self.signal) # in case the cues overlap
+
+    def play(self, when:float):
+        self.player.play(self.signal, when)
+
+    def stop(self):
+        self.player.stop()
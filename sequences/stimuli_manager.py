@@ -66,6 +66,17 @@ def get_stims(input_dir:str, sequence:List[str], modality:str, lang:str)-> List[
         stim_paths.append(stim)
     return stim_paths
 
+def get_stim_catalog(input_dir:str, lang:str)-> Dict[str, Dict[str, str]]:
+    '''Index the stimuli of a language by item name with a single scan of the stims directory.
+    Returns a dict that looks like this: {'bear': {'cat': 'animals', 'img': path, 'txt': path}, ...}
+    '''
+    catalog = defaultdict(dict)
+    for stim in sorted(glob.glob(os.path.join(input_dir, 'stims', lang, '*', '*.png'))):
+        item, modality = os.path.splitext(os.path.basename(stim))[0].rsplit('_', 1)
+        catalog[item]['cat'] = get_cat_from_stim(stim)
+        catalog[item][modality] = stim
+    return dict(catalog)
+
 def count_dupes(arr:List)-> int:
     '''Count the number of duplicates in a list'''
     seen = set()
@@ -355,6 +366,28 @@ def get_trial_feedback(n_points:int, max_points:int, lang:str)-> str:
 
     return messages[lang][-1][1] # if issue, return the last message
 
+def get_instr_intro_txt(lang:str)-> str:
+    '''Return the message typed before the instructions'''
+    if lang == 'fr':
+        return "Nous allons présenter les instructions.\nAppuyez sur le bouton central pour continuer."
+    return "We are going to present the instructions.\nPress the middle key to continue."
+
+def get_block_start_txt(block_id:int, lang:str)-> str:
+    '''Return the message presented at the beginning of a block'''
+    if lang == 'fr':
+        return f"Bloc {block_id} \nAttendez le feu vert de l'experimentateur, puis appuyez sur le bouton central pour commencer!"
+    return f"Block {block_id} \nWait for the experimenter's signal, then press the middle key to start!"
+
+def get_block_info_txt(block_id:int, end_of_block:bool, lang:str)-> str:
+    '''Return the message presented after the trial feedback (next trial or end of the block)'''
+    if end_of_block:
+        if lang == 'fr':
+            return f"Fin du bloc {block_id}. \nRépondez aux questions suivantes et profitez d'une courte pause."
+        return f"End of block {block_id}. \nAnswer the following questions and enjoy a short break."
+    if lang == 'fr':
+        return "L'essai suivant va commencer."
+    return "The next trial will start."
+
 def get_fb_sound(reward_sounds, n_points:int):
     ''' Return the reward sound (psychopy.sound) based on the number of points obtained for this question.'''
     if n_points < 3:
@@ -364,10 +397,11 @@ def get_fb_sound(reward_sounds, n_points:int):
     else:
         raise ValueError(f"Invalid number of points: {n_points}")
 
-def run_question(tools:dict, slots:dict, start_item, end_item, rt_clock, global_clock, t_act:float, key_dict:dict, trig_dict:dict)-> Tuple[int, float]:
+def run_question(tools:dict, slots:dict, start_item, end_item, rt_clock, global_clock, t_act:float, key_dict:dict, trig_dict:dict, static_layer=None, t_poll:float=0.002)-> Tuple[int, float]:
     '''Run a question where the participant has to place the second item in the correct position.
     NB : it adds 1 to the returned index to takes into account the first item of the sequence (which is not
-    selectable)'''
+    selectable). static_layer (optional) is a pre-composited image of the background, the slots and the start item.
+    The screen is only redrawn when the highlight moves, the keys and the timeout are polled every t_poll seconds.'''
 
     demo = False # added after the demo was implemented
     if 'demo' in tools:
@@ -384,12 +418,17 @@ def run_question(tools:dict, slots:dict, start_item, end_item, rt_clock, global_
 
     def draw_all():
         ''' Draw the slots, the start item and the background'''
+        if static_layer is not None:
+            static_layer.draw()
+            for slot in slots:
+                slot["highlight"].draw()
+            end_item.draw()
+            return
         tools['background'].draw()
         for slot in slots:
             slot["rect"].draw()
             slot["highlight"].draw()
         start_item.draw()
-        start_item.draw()
         end_item.draw()
 
     def reset_highlight(slots):
@@ -403,30 +442,38 @@ def run_question(tools:dict, slots:dict, start_item, end_item, rt_clock, global_
     running = True
     global_clock.reset()
     rt_clock.reset()
+    dirty = True # something changed on screen since the last flip
 
     while running:
 
-        draw_all()
-        tools['win'].flip()
+        if dirty:
+            draw_all()
+            tools['win'].flip()
+            dirty = False
+        else:
+            wait_fun(t_poll, scale=False, hogCPUperiod=0)
 
         if iterations == 0:
-            wait_fun(0.01)
+            wait_fun(0.01, scale=False)
             clear_event_fun()
         else:
             if highlight_onset is None:
                 slots[current_index]["highlight"].opacity = 1
                 highlight_onset = True
+                dirty = True
 
             keys = event_fun()
 
             if left_key in keys:
                 current_index = move_highlight(slots, current_index=current_index, direction="left")
+                dirty = True
                 if not demo:
                     trig_fun(trig_dict['misc']['left'])
                     tools['logger'].info(f"Left key pressed, current index: {current_index+1}")
 
             if right_key in keys:
                 current_index = move_highlight(slots, current_index=current_index, direction="right")
+                dirty = True
                 if not demo:
                     trig_fun(trig_dict['misc']['right'])
                     tools['logger'].info(f"Right key pressed, current index: {current_index+1}")
@@ -500,7 +547,15 @@ def move_highlight(slots:dict, current_index:int, direction:bool=None)-> int:
     return current_index
         
 def fade_out(tools, obj, clock, f_dur):
-    ''' Fade out the object'''
+    ''' Fade out the object. If a frame engine is in tools, the fade is done over a fixed number of refreshes.'''
+    if 'engine' in tools:
+        n_frames = tools['engine'].n_frames(f_dur)
+        for frame in range(n_frames):
+            obj.opacity = 1.0 - (frame / n_frames) # linear fade-out
+            tools['background'].draw()
+            obj.draw()
+            tools['win'].flip()
+        return
     clock.reset()
     while clock.getTime() < f_dur:
         elapsed_time = clock.getTime()
@@ -524,29 +579,17 @@ def move_slider(slider, slider_positions:List[float], y:float, current_pos:int,
     slider.pos = (pos, y)
     return current_pos
 
-def rotate(w_imgs:list, current_idx:int):
-    ''' Rotate the wheel images to the next one'''
-    if current_idx == len(w_imgs)-1:
-        current_idx = 0
-    else:
-        current_idx += 1
-    return current_idx
-
-def display_wheel(tools, wclock, rclock, tw, tr, wh_imgs, instr):
-    ''' Display spinning wheel for tw seconds, rotating every tr seconds.'''
-    current_idx = 0
-    rclock.reset()
-    wclock.reset()
-    while wclock.getTime() < tw:
-        t = rclock.getTime()
-        if t > tr:
-            current_idx = rotate(wh_imgs, current_idx)
-            rclock.reset()
-        tools['background'].draw()
-        instr.draw()
-        wh_imgs[current_idx].draw()
-        tools['win'].flip()
-    return
+def display_wheel(tools, n_frames:int, frames_per_img:int, wheel, static:list)-> int:
+    ''' Display the spinning wheel for n_frames refreshes, turning it every frames_per_img refreshes.
+    wheel is a sprite sheet (one frame per wheel image), static the stimuli drawn below it. The screen is only
+    redrawn when the wheel turns and the deferred work (tools['deferred']) is run in between.
+    Returns the number of deferred tasks that were run.'''
+    def draw(i):
+        wheel.set_frame(i)
+        for obj in static:
+            obj.draw()
+        wheel.draw()
+    return tools['engine'].idle(draw, n_frames, frames_per_img, tasks=tools.get('deferred'))
 
 """
 ********   TEST FUNCTIONS   *********
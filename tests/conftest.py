@@ -0,0 +1,14 @@
+import pytest
+from sequences import headless
+
+# the tests run on the headless backend (see sequences/headless.py): it has to be installed before psychopy.visual
+# is imported by the modules under test
+headless.install()
+
+@pytest.fixture(autouse=True)
+def virtual_clock():
+    ''' Restart the virtual clock and the recorders of the backend for each test'''
+    headless._now[0] = 0.
+    headless.counters.clear()
+    headless.events.clear()
+    yield
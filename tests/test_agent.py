@@ -0,0 +1,52 @@
+import pytest
+from psychopy import core
+import sequences.params as pm
+from sequences.agent import SimulatedParticipant
+from sequences.bonus_q import BonusState
+
+def presses(agent)-> list:
+    ''' Every planned key, pressed in order'''
+    core.wait(1000)
+    return agent.get_keys()
+
+def test_question_keys_come_at_their_time():
+    agent = SimulatedParticipant(accuracy=1, seed=1)
+    agent.expect('question', answer=2, n_slots=4)
+    assert agent.get_keys() == [] # nothing before the decision time
+    (t_first, _), (t_last, _) = agent.plan[0], agent.plan[-1]
+    core.wait(t_first)
+    assert agent.get_keys() == [pm.key_dict['right']]
+    assert t_last - t_first == pytest.approx(2 * agent.key_interval)
+    assert presses(agent) == [pm.key_dict['right'], pm.key_dict['confirm']]
+
+def test_wrong_answers_follow_the_accuracy():
+    agent = SimulatedParticipant(accuracy=0, seed=1)
+    for _ in range(20):
+        agent.expect('question', answer=1, n_slots=3)
+        assert presses(agent).count(pm.key_dict['right']) != 1
+
+def test_likert_moves_from_the_start_tick():
+    agent = SimulatedParticipant(likert=[0, 0, 0, 0, 1], seed=1)
+    agent.expect('likert', n_ticks=5, start=1)
+    assert presses(agent) == [pm.key_dict['right']] * 3 + [pm.key_dict['confirm']]
+
+def test_time_scale_shortens_the_times():
+    slow, fast = SimulatedParticipant(seed=3), SimulatedParticipant(seed=3)
+    fast.time_scale = 10
+    for agent in (slow, fast):
+        agent.expect('question', answer=0, n_slots=4)
+    assert fast.plan[0][0] == pytest.approx(slow.plan[0][0] / 10)
+
+def test_bonus_presses_place_the_targets_in_order():
+    state = BonusState(n_pos=36, n_slots=4, blocked=[0])
+    targets = [7, 30, 2, 35]
+    agent = SimulatedParticipant(bonus_accuracy=1, seed=1)
+    agent.expect('bonus', state=state, targets=targets, cursor=0)
+    directions = {key: d for d, key in pm.key_bq.items()}
+    cursor = 0
+    for key in presses(agent): # replay the keys on the real state
+        if directions[key] == 'confirm':
+            state.place(cursor)
+        else:
+            cursor = state.move_cursor(cursor, directions[key])
+    assert list(state.image_in) == targets
@@ -0,0 +1,23 @@
+from sequences.assets import AssetStore, hash_file
+
+def test_identical_files_share_one_entry(tmp_path):
+    for lang in ('en', 'fr'):
+        (tmp_path / lang).mkdir()
+        (tmp_path / lang / 'cat.png').write_bytes(b'same image')
+    (tmp_path / 'fr' / 'dog.png').write_bytes(b'other image')
+    en, fr, dog = (str(tmp_path / p) for p in ('en/cat.png', 'fr/cat.png', 'fr/dog.png'))
+
+    store = AssetStore()
+    assert store.key(en) == store.key(fr) == hash_file(en)
+    assert store.key(dog) != store.key(en)
+    assert store.source(fr) == en # the first path indexed is the one that is read
+    assert store.source(dog) == dog
+    assert store.stats() == {'files': 3, 'unique': 2}
+
+def test_each_path_is_hashed_once(tmp_path):
+    path = tmp_path / 'cat.png'
+    path.write_bytes(b'image')
+    store = AssetStore()
+    digest = store.key(str(path))
+    path.write_bytes(b'changed') # not read again
+    assert store.key(str(path)) == digest
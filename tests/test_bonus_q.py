@@ -0,0 +1,49 @@
+import numpy as np
+from sequences.bonus_q import BonusState, neighbor_tables
+
+def test_undo_empties_the_slots_in_reverse_order():
+    state = BonusState(n_pos=36, n_slots=3)
+    assert [state.place(pos) for pos in (4, 9, 2)] == [0, 1, 2]
+    assert state.is_full()
+    assert state.undo() == (2, 2)
+    assert state.undo() == (9, 1)
+    assert state.n_filled == 1
+    assert state.slot_of[9] == -1 and state.slot_of[2] == -1
+    assert list(state.image_in) == [4, -1, -1]
+    assert state.place(2) == 1 # the freed slot is the next one filled
+
+def test_undo_with_empty_slots():
+    state = BonusState(n_pos=36, n_slots=3)
+    assert state.undo() is None
+    assert state.n_filled == 0
+
+def test_placed_and_blocked_positions_do_not_move():
+    state = BonusState(n_pos=36, n_slots=2, blocked=[0])
+    assert state.place(0) == -1
+    assert state.place(5) == 0
+    assert state.place(5) == -1
+    assert state.place(6) == 1
+    assert state.place(7) == -1 # full
+    assert np.count_nonzero(state.slot_of >= 0) == 2
+
+def test_neighbors_numbered_column_by_column():
+    nb = neighbor_tables(rows=3, cols=2, n=6) # positions 0 1 2 in the first column, 3 4 5 in the second
+    assert nb['down'] == [1, 2, -1, 4, 5, -1]
+    assert nb['up'] == [-1, 0, 1, -1, 3, 4]
+    assert nb['right'] == [3, 4, 5, -1, -1, -1]
+    assert nb['left'] == [-1, -1, -1, 0, 1, 2]
+
+def test_neighbors_of_an_incomplete_grid():
+    nb = neighbor_tables(rows=3, cols=2, n=5) # the last cell is missing
+    assert nb['down'][4] == -1
+    assert nb['right'][2] == -1
+
+def test_cursor_skips_the_placed_images():
+    state = BonusState(n_pos=36, n_slots=6, blocked=[2])
+    state.place(1)
+    assert state.move_cursor(0, 'down') == 3 # 1 placed, 2 blocked
+    assert state.move_cursor(0, 'right') == 6
+    assert state.move_cursor(0, 'up') == 0 # edge, the cursor stays
+    state.place(7)
+    state.place(13)
+    assert state.move_cursor(1, 'right') == 19
@@ -0,0 +1,43 @@
+import json
+import numpy as np
+import pytest
+from scipy.io import wavfile
+from build_sound_cache import build_cache, convert, manifest_name
+
+def test_signed_integers_are_scaled():
+    out = convert(np.array([0, 16384, -32767], dtype=np.int16), 1000, 1000, 1)
+    assert out.dtype == np.float32
+    assert out[:, 0] == pytest.approx([0, 0.5, -1], abs=1e-4)
+
+def test_unsigned_integers_are_centered():
+    out = convert(np.array([128, 255, 0, 192], dtype=np.uint8), 1000, 1000, 1)
+    assert out[:, 0] == pytest.approx([0, 127 / 128, -1, 0.5])
+
+def test_floats_are_kept_and_clipped():
+    out = convert(np.array([0.25, 1.5], dtype=np.float64), 1000, 1000, 1)
+    assert out[:, 0].tolist() == [0.25, 1]
+
+def test_resampling_keeps_the_duration():
+    t = np.arange(1000) / 1000
+    out = convert(np.sin(2 * np.pi * 5 * t).astype(np.float32), 1000, 3000, 1)
+    assert out.shape == (3000, 1)
+    assert out[::3, 0] == pytest.approx(np.sin(2 * np.pi * 5 * t), abs=0.01)
+
+def test_channels_go_through_mono():
+    stereo = np.array([[0.2, 0.4], [-0.2, 0.]], dtype=np.float32)
+    assert convert(stereo, 1000, 1000, 1)[:, 0] == pytest.approx([0.3, -0.1])
+    assert convert(stereo[:, :1], 1000, 1000, 2) == pytest.approx(np.array([[0.2, 0.2], [-0.2, -0.2]]))
+
+def test_cache_is_rebuilt_only_when_needed(tmp_path, capsys):
+    src = tmp_path / 'a.wav'
+    wavfile.write(src, 1000, np.zeros(100, dtype=np.int16))
+    fmt = {'sample_rate': 2000, 'channels': 2}
+    cache_dir = tmp_path / 'cache'
+    manifest = build_cache([str(src)], str(cache_dir), fmt)
+    digest = manifest['sources'][str(src)]
+    rate, signal = wavfile.read(cache_dir / f'{digest}.wav')
+    assert (rate, signal.shape, signal.dtype) == (2000, (200, 2), np.float32)
+    build_cache([str(src)], str(cache_dir), fmt)
+    assert '0 sounds converted' in capsys.readouterr().out.splitlines()[-1]
+    build_cache([str(src)], str(cache_dir), {'sample_rate': 1000, 'channels': 1}) # other device: all converted again
+    assert json.loads((cache_dir / manifest_name).read_text())['format'] == {'sample_rate': 1000, 'channels': 1}
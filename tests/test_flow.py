@@ -0,0 +1,48 @@
+import pytest
+from psychopy import visual
+from sequences import flow as fl
+from sequences import headless
+
+def recorder():
+    calls = []
+    def wait(secs, **kwargs):
+        calls.append((secs, kwargs))
+    return wait, calls
+
+def test_scaled_wait_divides_the_durations():
+    wait, calls = recorder()
+    fl.scaled_wait(wait, 10)(1.5, hogCPUperiod=0)
+    assert calls == [(pytest.approx(0.15), {'hogCPUperiod': 0})]
+
+def test_polling_intervals_are_not_scaled():
+    wait, calls = recorder()
+    fl.scaled_wait(wait, 50)(0.002, scale=False, hogCPUperiod=0)
+    assert calls == [(0.002, {'hogCPUperiod': 0})]
+
+def test_scaled_wait_accepts_scale_without_time_scale():
+    wait, calls = recorder()
+    scaled = fl.scaled_wait(wait, 1)
+    scaled(0.5)
+    scaled(0.002, scale=False)
+    assert [secs for secs, _ in calls] == [0.5, 0.002]
+
+def test_scale_dur():
+    assert fl.scale_dur({'time_scale': 4}, 2) == 0.5
+    assert fl.scale_dur({}, 2) == 2 # tools of the standalone scripts have no time scale
+
+def test_type_text_reveals_one_layout():
+    win = visual.Window()
+    fl.type_text('ab\ncd', win, t=0)
+    assert headless.counters['alloc_TextBox2'] == 1
+    assert headless.counters['alloc_Aperture'] == 1
+    assert headless.counters['alloc_TextStim'] == 0
+    assert headless.counters['flips'] == 5 # one per character, the newline included
+
+def test_reveal_cutoffs_follow_the_caret():
+    text_stim = visual.TextBox2(visual.Window(), text='ab\ncd')
+    top = 0.9 * text_stim.letterHeightPix # band above the row bottom
+    assert fl.reveal_cutoffs(text_stim).tolist() == [[10, top], [20, top], [0, top - 30], [10, top - 30], [20, top - 30]]
+
+def test_reveal_shape_covers_the_rows_above_and_the_band_left_of_the_cutoff():
+    shape = fl.reveal_shape((100, 50), letter_px=20)
+    assert shape.tolist() == [[-200, 100], [200, 100], [200, 0], [0, 0], [0, -24], [-200, -24]]
@@ -0,0 +1,43 @@
+import pytest
+from psychopy import core, visual
+from sequences import headless
+
+frame_dur = 1 / headless.frate
+
+def test_wait_moves_the_virtual_clock():
+    core.wait(1.5)
+    assert core.getTime() == pytest.approx(1.5)
+
+def test_flip_waits_for_the_next_refresh():
+    win = visual.Window()
+    core.wait(0.4 * frame_dur)
+    assert win.flip() == pytest.approx(frame_dur)
+    assert win.flip() == pytest.approx(2 * frame_dur)
+
+def test_flip_time_is_taken_before_the_callbacks():
+    win = visual.Window()
+    calls = []
+    win.callOnFlip(lambda: calls.append(core.getTime()) or core.wait(0.012)) # like the trigger gap
+    t = win.flip()
+    assert calls == [pytest.approx(t)]
+    assert win.flip() == pytest.approx(t + frame_dur) # the wait does not push the next refresh
+    win.flip()
+    assert calls == [pytest.approx(t)] # called once
+
+def test_sounds_and_triggers_are_recorded():
+    headless.Sound('cue').play(when=0.1)
+    headless.TriggerRecorder().signal(7)
+    assert headless.events == [(pytest.approx(0.1), 'sound', 'cue'), (0., 'trigger', 7)]
+    assert headless.stats()['sounds_played'] == 1
+
+@pytest.mark.parametrize('when', [0, -0.01])
+def test_play_rejects_non_positive_delays(when):
+    with pytest.raises(AssertionError):
+        headless.Sound('cue').play(when=when)
+
+def test_stims_keep_their_attributes():
+    stim = visual.TextStim(None, text='hello', height=0.1)
+    assert (stim.text, stim.height, stim.color) == ('hello', 0.1, None)
+    stim.draw()
+    assert headless.counters['alloc_TextStim'] == 1
+    assert headless.counters['draws'] == 1
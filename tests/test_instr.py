@@ -0,0 +1,28 @@
+import pytest
+import sequences.instr as it
+
+@pytest.fixture
+def instructions(tmp_path, monkeypatch):
+    for lang, files in {'fr': {'a.txt': 'bonjour', 'b.txt': 'merci'}, 'en': {'a.txt': 'hello'}}.items():
+        (tmp_path / 'instructions' / lang).mkdir(parents=True)
+        for fn, txt in files.items():
+            (tmp_path / 'instructions' / lang / fn).write_text(txt, encoding='utf-8')
+    monkeypatch.setattr(it, 'input_dir', str(tmp_path))
+    monkeypatch.setattr(it, 'instr_fnames', {'instr_a': 'a.txt', 'instr_b': 'b.txt'})
+    monkeypatch.setattr(it, 'registry', {})
+    it.load_registry()
+    return tmp_path
+
+def test_texts_of_each_language(instructions):
+    assert it.get_txt('en', 'instr_a') == 'hello'
+    assert it.get_txt('fr', 'instr_a') == 'bonjour'
+
+def test_missing_file_falls_back_to_french(instructions):
+    assert it.get_txt('en', 'instr_b') == 'merci'
+
+def test_unknown_language_falls_back_to_french(instructions):
+    assert it.get_txt('de', 'instr_a') == 'bonjour'
+
+def test_lookups_do_not_read_the_files(instructions):
+    (instructions / 'instructions' / 'en' / 'a.txt').write_text('changed', encoding='utf-8')
+    assert it.get_txt('en', 'instr_a') == 'hello'
@@ -0,0 +1,95 @@
+import pytest
+from psychopy import core, visual
+from sequences import headless
+from sequences.presentation import FrameEngine, to_frames
+
+frame_dur = 1 / headless.frate
+
+class SlowStim(headless.Stim):
+    ''' Stim whose draw takes n_late frames at the draw number late_at'''
+
+    def __init__(self, late_at:int, n_late:float):
+        super().__init__()
+        self.late_at = late_at
+        self.n_late = n_late
+        self.n_draws = 0
+
+    def draw(self, win=None):
+        self.n_draws += 1
+        if self.n_draws == self.late_at:
+            core.wait(self.n_late * frame_dur)
+
+@pytest.fixture
+def engine():
+    return FrameEngine(visual.Window(), headless.frate, audio_latency=0.05)
+
+def test_present_lasts_n_frames(engine):
+    dropped = engine.present([visual.TextStim()], 10)
+    assert dropped == 0
+    assert headless.counters['flips'] == 10
+    assert engine.last_flip - engine.onset == pytest.approx(9 * frame_dur)
+
+def test_present_counts_dropped_frames(engine):
+    dropped = engine.present([SlowStim(late_at=4, n_late=2)], 10)
+    assert dropped == 2
+    assert headless.counters['flips'] == 8 # the screen still ends on its last frame
+    assert engine.last_flip - engine.onset == pytest.approx(9 * frame_dur)
+
+def test_present_task_frames_are_not_dropped(engine):
+    dropped = engine.present([visual.TextStim()], 10, task=lambda: core.wait(3 * frame_dur))
+    assert dropped == 0
+    assert engine.last_flip - engine.onset == pytest.approx(9 * frame_dur)
+
+def test_present_no_frames(engine):
+    assert engine.present([visual.TextStim()], 0) == 0
+    assert headless.counters['flips'] == 0
+
+def test_short_durations_last_one_frame():
+    assert to_frames(0.3 / 50, 60) == 1 # 0.36 frame
+    assert to_frames(0, 60) == 0
+    assert to_frames(0.3, 60) == 18
+
+def test_onset_is_not_left_over(engine):
+    engine.present([visual.TextStim()], 2)
+    engine.present([visual.TextStim()], 0)
+    assert engine.onset is None
+
+def test_n_frames_time_scale():
+    engine = FrameEngine(visual.Window(), 60, time_scale=2)
+    assert engine.n_frames(1) == 30
+
+
+def test_next_flip_on_the_grid(engine):
+    engine.present([visual.TextStim()], 3)
+    core.wait(0.3 * frame_dur)
+    assert engine.next_flip() == pytest.approx(engine.last_flip + frame_dur)
+    assert engine.next_flip(lead=frame_dur) == pytest.approx(engine.last_flip + 2 * frame_dur)
+
+def test_next_flip_from_a_given_time(engine):
+    engine.present([visual.TextStim()], 3)
+    now = engine.last_flip + 0.5 * frame_dur
+    assert engine.next_flip(lead=2 * frame_dur, now=now) == pytest.approx(engine.last_flip + 3 * frame_dur)
+
+def test_schedule_sound_starts_on_the_onset_flip(engine):
+    engine.present([visual.TextStim()], 3)
+    core.wait(60) # a long screen drawn without the engine: the grid has to be resynced
+    onset = engine.schedule_sound(headless.Sound('cue'), hold=[visual.ImageStim()])
+    (t_sound, _, _), = headless.events
+    assert t_sound == pytest.approx(onset)
+    assert onset - engine.last_flip == pytest.approx(frame_dur) # the hold screen is kept until the onset
+    engine.present([visual.TextStim()], 3)
+    assert engine.onset == pytest.approx(onset)
+
+def test_schedule_sound_is_at_least_one_latency_ahead(engine):
+    onset = engine.schedule_sound(headless.Sound('cue'), hold=[])
+    resync = frame_dur # first refresh of the virtual clock, play() is called right after it
+    assert onset - resync >= engine.audio_latency + engine.audio_margin
+    assert onset - resync == pytest.approx(4 * frame_dur) # 52 ms ahead: the 4th refresh at 60 Hz
+    assert headless.counters['flips'] == 4 # resync + 3 held refreshes
+
+def test_schedule_sound_holds_only_the_given_screen(engine):
+    old, hold = SlowStim(late_at=0, n_late=0), SlowStim(late_at=0, n_late=0)
+    engine.present([old], 2)
+    engine.schedule_sound(headless.Sound('cue'), hold=[hold])
+    assert old.n_draws == 2 # never redrawn after its own screen
+    assert hold.n_draws == 4
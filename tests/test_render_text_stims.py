@@ -0,0 +1,16 @@
+import pytest
+from render_text_stims import check_items, read_word_list
+
+def test_word_list_matches_the_stimuli():
+    table = read_word_list()
+    check_items(table, ['en', 'fr'])
+    assert not table.duplicated(['category', 'item']).any()
+
+def test_missing_and_extra_items_are_reported(tmp_path):
+    for item in ('cat', 'dog'):
+        (tmp_path / 'fr' / 'animals').mkdir(parents=True, exist_ok=True)
+        (tmp_path / 'fr' / 'animals' / f'{item}_img.png').touch()
+    table = read_word_list()
+    table = table[table['category'] == 'animals'].head(2) # bear, cat
+    with pytest.raises(ValueError, match=r"no fr word for \[\('animals', 'dog'\)\], no image for \[\('animals', 'bear'\)\]"):
+        check_items(table, ['fr'], root=tmp_path)
@@ -0,0 +1,22 @@
+import shutil
+import pytest
+import sequences.params as pm
+from sequences import headless
+from sequences.agent import SimulatedParticipant
+from run_headless import run_session
+
+subject_id = '97'
+
+@pytest.fixture
+def output():
+    yield
+    shutil.rmtree(pm.output_dir / f'sub-{subject_id}', ignore_errors=True)
+
+@pytest.mark.parametrize('frate', [60, 120])
+def test_debugging_run(output, monkeypatch, frate):
+    ''' A whole run in debugging mode: with the debug time scale, most durations are shorter than a refresh'''
+    monkeypatch.setattr(headless, 'frate', frate)
+    stats = run_session(subject_id=subject_id, runs=('01',), participant=SimulatedParticipant(seed=1), debugging=True)
+    assert stats['windows_closed'] == 1
+    assert stats['streams_opened'] == 1
+    assert stats['triggers'] > 0
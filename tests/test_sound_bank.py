@@ -0,0 +1,43 @@
+from sequences import headless
+from sequences.assets import hash_file
+from sequences.sounds import SoundBank, cached_path
+
+def make_sounds(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / f'{name}.wav'
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+    return paths
+
+def test_sounds_are_decoded_once(tmp_path):
+    a, b = make_sounds(tmp_path, ['a', 'b'])
+    bank = SoundBank([a, b])
+    assert bank.get(a) is bank.get(a)
+    assert headless.counters['sounds_loaded'] == 2
+    assert bank.stats()['misses'] == 0
+
+def test_sounds_not_added_are_loaded_on_demand(tmp_path):
+    a, b = make_sounds(tmp_path, ['a', 'b'])
+    bank = SoundBank([a])
+    assert bank.get_all({'A': a, 'B': b}) == {'A': bank.get(a), 'B': bank.get(b)}
+    assert bank.stats()['misses'] == 1
+    assert bank.stats()['sounds'] == 2
+
+def test_converted_copies_are_used(tmp_path):
+    a, b = make_sounds(tmp_path, ['a', 'b'])
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    converted = cache_dir / f'{hash_file(a)}.wav'
+    converted.write_bytes(b'converted')
+    assert cached_path(a, str(cache_dir)) == str(converted)
+    assert cached_path(b, str(cache_dir)) is None
+    bank = SoundBank([a, b], cache_dir=str(cache_dir))
+    assert bank.get(a).value == str(converted) # read instead of the source
+    assert bank.get(b).value == b
+    assert bank.stats()['cached'] == 1
+
+def test_missing_cache_dir_reads_the_sources(tmp_path):
+    a, = make_sounds(tmp_path, ['a'])
+    bank = SoundBank([a], cache_dir=str(tmp_path / 'missing'))
+    assert bank.get(a).value == a
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from sequences import headless
+from sequences.sounds import SequenceTrack, TrackPlayer
+
+def test_track_mixes_the_sound_at_the_onsets():
+    player = TrackPlayer(1000, 1)
+    track = SequenceTrack(np.full(10, 0.5), 1000, [0, 0.05, 0.12], player)
+    assert track.signal.shape == (130, 1)
+    starts = np.flatnonzero(np.diff(np.concatenate([[0], track.signal[:, 0]])) > 0)
+    assert list(starts) == [0, 50, 120]
+    assert track.signal.sum() == pytest.approx(3 * 10 * 0.5)
+
+def test_track_overlapping_cues_are_clipped():
+    track = SequenceTrack(np.full(10, 0.8), 1000, [0, 0.005], TrackPlayer(1000, 1))
+    assert track.signal.max() == 1
+
+def test_track_in_the_format_of_the_stream():
+    track = SequenceTrack(np.ones(10), 1000, [0], TrackPlayer(1000, 2))
+    assert track.signal.shape == (10, 2)
+    with pytest.raises(ValueError):
+        SequenceTrack(np.ones(10), 44100, [0], TrackPlayer(1000, 1))
+
+def test_one_stream_for_all_the_tracks():
+    player = TrackPlayer(1000, 1)
+    for _ in range(3):
+        SequenceTrack(np.ones(10), 1000, [0, 0.1], player).play(when=0.05)
+    assert headless.counters['streams_opened'] == 1
+    assert player.n_played == 3
+
+def test_player_writes_the_track_from_its_onset():
+    player = TrackPlayer(1000, 1)
+    signal = np.arange(1, 101, dtype=np.float32)[:, np.newaxis]
+    player.play(signal, when=0.1)
+    out = np.full((64, 1), np.nan, dtype=np.float32)
+    player._callback(out, 64, SimpleNamespace(outputBufferDacTime=0.08), None) # the onset is 20 samples in
+    assert not out[:20].any()
+    assert np.array_equal(out[20:, 0], signal[:44, 0])
+    player._callback(out, 64, SimpleNamespace(outputBufferDacTime=0.144), None) # next buffer
+    assert np.array_equal(out[:56, 0], signal[44:, 0])
+    assert not out[56:].any()
+
+def test_player_rejects_late_starts():
+    with pytest.raises(AssertionError):
+        TrackPlayer(1000, 1).play(np.ones((10, 1), dtype=np.float32), when=0)
@@ -0,0 +1,23 @@
+import sequences.params as pm
+import sequences.stimuli_manager as sm
+
+def make_stims(root, lang:str, files:dict):
+    for cat, names in files.items():
+        (root / 'stims' / lang / cat).mkdir(parents=True)
+        for name in names:
+            (root / 'stims' / lang / cat / name).write_bytes(b'png')
+
+def test_catalog_indexes_the_items(tmp_path):
+    make_stims(tmp_path, 'fr', {'animals': ['bear_img.png', 'bear_txt.png'], 'colors': ['red_img.png', 'notes.txt']})
+    catalog = sm.get_stim_catalog(str(tmp_path), 'fr')
+    assert catalog == {
+        'bear': {'cat': 'animals', 'img': str(tmp_path / 'stims/fr/animals/bear_img.png'),
+            'txt': str(tmp_path / 'stims/fr/animals/bear_txt.png')},
+        'red': {'cat': 'colors', 'img': str(tmp_path / 'stims/fr/colors/red_img.png')},
+    }
+
+def test_catalog_matches_the_directory_lookup():
+    catalog = sm.get_stim_catalog(pm.input_dir, 'fr')
+    items = sorted(catalog)[:6]
+    for modality in ('img', 'txt'):
+        assert sm.get_stims(pm.input_dir, items, modality, 'fr') == [catalog[item][modality] for item in items]
@@ -0,0 +1,46 @@
+import pytest
+from psychopy import visual
+import sequences.params as pm
+import sequences.instr as it
+from sequences import headless
+from sequences.presentation import TextCache
+
+@pytest.fixture
+def texts():
+    return TextCache(visual.Window())
+
+def test_messages_are_laid_out_once(texts):
+    stim = texts.add('Bravo !', color='green')
+    assert texts.get('Bravo !', color='green') is stim
+    assert texts.misses == 0
+    assert headless.counters['alloc_TextStim'] == 1
+
+def test_messages_are_keyed_by_style(texts):
+    green = texts.add('Bravo !', color='green')
+    red = texts.get('Bravo !', color='red')
+    assert red is not green
+    assert (green.color, red.color) == ('green', 'red')
+    assert texts.misses == 1
+    assert texts.get('Bravo !', color='red') is red # laid out on the miss, cached since
+
+def test_defaults_are_part_of_the_style(texts):
+    stim = texts.add('Pause')
+    assert texts.get('Pause', color='black', font='Arial') is stim
+    assert texts.get('Pause', pos=[0, 0.5]) is texts.get('Pause', pos=(0, 0.5))
+
+@pytest.mark.parametrize('lang', ['fr', 'en'])
+def test_session_messages_are_cached(lang):
+    import pipeline
+    texts = pipeline.build_text_cache(visual.Window(), lang)
+    styles = pipeline.text_styles
+    texts.get(it.get_txt(lang, 'quest_ready_fn'), **styles['quest_ready'])
+    for quest in ['vigi', 'focus', 'think']:
+        texts.get(it.get_txt(lang, f'quest_{quest}_fn'), **styles['quest'])
+        st1, st2 = pm.stxt_dict[lang][quest]
+        texts.get(st1, **styles['scale_left'])
+        texts.get(st2, **styles['scale_right'])
+    texts.get(it.get_txt(lang, 'instr_pause_fn'), **styles['block_pause'])
+    texts.get(it.get_txt(lang, 'instr_pause_fn'), **styles['run_pause'])
+    texts.get(it.get_txt(lang, 'instr_tmr2'), **styles['tmr'])
+    texts.get(it.get_txt(lang, 'instr_q_fn'), **styles['instr_q'])
+    assert texts.misses == 0